@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""MQ benchmark runner.
+Runs main.smain()/amain() over a grid of workload dimensions × backends,
+writes result rows (per-phase time, msgs/s, RSS deltas) to JSON or CSV.
+"""
+# 1. std
+from typing import List, Dict, Iterable, Optional, Union, Tuple
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+# 3. local
+from const import W_COUNT, Q_COUNT, MSG_COUNT, MSG_LEN, Workload
+from gen import SIZE_DISTS
+from main import LOGGER, S_BACKENDS, A_BACKENDS, LOAD_TIME, Row, smain, amain, topologies, s_containers, \
+    a_containers, isolated, sload, _aload_run, swork, _awork_run
+from q import COALESCE_N, Durability, Limit, Qc, QSc
+from qar1 import ConfirmMode
+from rqsim import Broker
+# x. const
+TABLE = ('backend', 'batch', 'workers', 'ack', 'stream', 'writers', 'queues', 'msgs', 'msg_len', 'zipf', 'sizes',
+         'durability', 'pack', 't_put', 't_get', 'put_rate', 'get_rate', 'wire_msgs', 'wire_bytes',
+         'rate', 'achieved', 'p50', 'p99', 'p99.9', 'lat_max',
+         'consumers', 'service', 'prefetch', 't_work', 'work_rate', 'util',
+         'rss_base', 'rss_peak', 'rss_close', 'left')
+
+
+def env() -> Dict[str, Union[str, int]]:
+    """Where and what was run, to compare rows across commits and machines."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'ts': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'host': platform.node(),
+        'os': platform.system(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count() or 0,
+    }
+
+
+def write(rows: List[Row], path: Optional[str]):
+    """Save rows: *.csv - CSV, else JSON; stdout if no path."""
+    f = open(path, 'w', newline='') if path else sys.stdout
+    try:
+        if path and path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=list(dict.fromkeys(k for row in rows for k in row)))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=1, ensure_ascii=False)
+            f.write('\n')
+    finally:
+        if path:
+            f.close()
+
+
+def table(rows: List[Row]) -> Iterable[str]:
+    """Comparison table of rows."""
+    cols = [c for c in TABLE if any(c in row for row in rows)]
+    cells = [[str(row.get(c, '')) for c in cols] for row in rows]
+    widths = [max(len(c), *(len(line[i]) for line in cells)) for i, c in enumerate(cols)]
+    yield ' | '.join(c.ljust(w) for c, w in zip(cols, widths))
+    yield '-|-'.join('-' * w for w in widths)
+    for line in cells:
+        yield ' | '.join(v.ljust(w) if not i else v.rjust(w) for i, (v, w) in enumerate(zip(line, widths)))
+
+
+def run(grid: Iterable[Workload], backends: List[str], batches: List[bool], workers: Optional[str] = None,
+        lat: bool = False, broker: Optional[Broker] = None, confirms: Iterable[ConfirmMode] = (ConfirmMode.Each,),
+        consume: bool = False, pools: Iterable[str] = (), out: Optional[str] = None, isolate: bool = True,
+        ack: bool = False, stream: bool = False, limits: Optional[Tuple[Limit, Limit]] = None,
+        coalesce: Optional[Tuple[float, int]] = None, packs: Iterable[int] = (0,),
+        durabilities: Iterable[Optional[Durability]] = (None,)) -> List[Row]:
+    """Run the grid; rows are rewritten to `out` after each point (a broken sweep keeps the rest).
+    :param isolate: each backend run in a fresh child process
+    :param ack: read by get_ack()/ack()
+    :param stream: async read by `async for`/stream()
+    :param limits: in-memory queue/container ceilings (spill to disk)
+    :param coalesce: async put() coalescing: max delay, s, and max msgs per flush
+    :param packs: messages per envelope to try (0: no packing)
+    :param durabilities: disk/RabbitMQ durability policies to try (None: backend default)
+    """
+    head = env()
+    ret = []
+    for wl in grid:
+        for batch, pack, durability in itertools.product(batches, packs, durabilities):
+            rows = []
+            if any(b in S_BACKENDS for b in backends):
+                rows += smain(batch, workers, lat, broker, consume, backends, wl, isolate, ack, limits, pack,
+                              durability)
+            if any(b in A_BACKENDS for b in backends):
+                rows += amain(batch, lat, broker, confirms, consume, topologies(pools), backends, wl, isolate,
+                              ack, stream, limits, coalesce, pack, durability)
+            ret.extend({**head, **row} for row in rows)
+            if out:
+                write(ret, out)
+    return ret
+
+
+def run_load(grid: Iterable[Workload], backends: List[str], rates: List[float], duration: float = LOAD_TIME,
+             broker: Optional[Broker] = None, confirms: Iterable[ConfirmMode] = (ConfirmMode.Each,),
+             consume: bool = False, pools: Iterable[str] = (), out: Optional[str] = None, isolate: bool = True,
+             coalesce: Optional[Tuple[float, int]] = None) -> List[Row]:
+    """Open-loop sweep: latency vs offered load, a row per backend × rate."""
+    head = env()
+    ret = []
+    for wl in grid:
+        qcs: List[Qc] = s_containers([b for b in backends if b in S_BACKENDS], broker, consume, wl=wl) \
+            + a_containers([b for b in backends if b in A_BACKENDS], broker, confirms, consume, topologies(pools),
+                           coalesce=coalesce)
+        for qc in qcs:
+            test = sload if isinstance(qc, QSc) else _aload_run
+            for rate in rates:
+                if isolate:
+                    row = isolated(test, qc, rate=rate, duration=duration, wl=wl)
+                else:
+                    row = test(qc, rate=rate, duration=duration, wl=wl)
+                ret.append({**head, **row})
+                if out:
+                    write(ret, out)
+    return ret
+
+
+def run_work(grid: Iterable[Workload], backends: List[str], consumers: List[int], services: List[float],
+             prefetches: List[int], broker: Optional[Broker] = None,
+             confirms: Iterable[ConfirmMode] = (ConfirmMode.Each,), pools: Iterable[str] = (),
+             out: Optional[str] = None, isolate: bool = True) -> List[Row]:
+    """Worker pool sweep: a row per backend × consumers × service time × prefetch."""
+    head = env()
+    ret = []
+    for wl in grid:
+        qcs: List[Qc] = s_containers([b for b in backends if b in S_BACKENDS], broker, wl=wl) \
+            + a_containers([b for b in backends if b in A_BACKENDS], broker, confirms, False, topologies(pools))
+        for qc in qcs:
+            test = swork if isinstance(qc, QSc) else _awork_run
+            for n, service, prefetch in itertools.product(consumers, services, prefetches):
+                kwargs = dict(consumers=n, service=service, prefetch=prefetch, wl=wl)
+                row = isolated(test, qc, **kwargs) if isolate else test(qc, **kwargs)
+                ret.append({**head, **row})
+                if out:
+                    write(ret, out)
+    return ret
+
+
+if __name__ == '__main__':
+    __parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    __parser.add_argument('-w', '--writers', type=int, nargs='+', default=[W_COUNT], help="writers (grid axis)")
+    __parser.add_argument('-q', '--queues', type=int, nargs='+', default=[Q_COUNT], help="queues (grid axis)")
+    __parser.add_argument('-m', '--msgs', type=int, nargs='+', default=[MSG_COUNT],
+                          help="messages per writer (grid axis)")
+    __parser.add_argument('-l', '--len', type=int, nargs='+', default=[MSG_LEN],
+                          help="message size, mean if varies (grid axis)")
+    __parser.add_argument('--zipf', type=float, nargs='+', default=[0.0],
+                          help="writers to queues Zipf skew, 0: round robin (grid axis)")
+    __parser.add_argument('--sizes', nargs='+', choices=SIZE_DISTS, default=['fixed'],
+                          help="message size distribution (grid axis)")
+    __parser.add_argument('--burst', type=int, default=0, help="on/off writers: msgs per burst")
+    __parser.add_argument('--gap', type=float, default=0.0, help="on/off writers: pause after a burst, s")
+    __parser.add_argument('--rate', type=float, nargs='+',
+                          help="open loop instead: offered loads, msgs/s (latency vs load curve)")
+    __parser.add_argument('--duration', type=float, default=LOAD_TIME, help="open loop: run time, s")
+    __parser.add_argument('--consumers', type=int, nargs='+',
+                          help="worker pool instead: competing consumers per queue (sweep)")
+    __parser.add_argument('--service', type=float, nargs='+', default=[0.001],
+                          help="worker pool: service time per message, s (sweep)")
+    __parser.add_argument('--prefetch', type=int, nargs='+', default=[1],
+                          help="worker pool: messages taken at once (sweep)")
+    __parser.add_argument('-b', '--backends', nargs='+', choices=S_BACKENDS + A_BACKENDS,
+                          default=list(S_BACKENDS + A_BACKENDS), help="backends to run")
+    __parser.add_argument('--batch', choices=('no', 'yes', 'both'), default='both',
+                          help="put()/get_all() and/or put_many()/get_many()")
+    __parser.add_argument('--workers', choices=('thread', 'process'), help="run sync writers/readers concurrently")
+    __parser.add_argument('--lat', action='store_true', help="per-call latency histograms")
+    __parser.add_argument('--confirm', action='append', choices=[m.name for m in ConfirmMode],
+                          help="aiormq publisher confirms (repeatable)")
+    __parser.add_argument('--consume', action='store_true', help="RabbitMQ get_all() by consumer, not polling")
+    __parser.add_argument('--pool', action='append', metavar='CONNSxCHANS',
+                          help="async RabbitMQ connections × channels per connection (repeatable; 'all' to sweep)")
+    __parser.add_argument('--ack', action='store_true', help="read by get_ack()/ack(multiple), at-least-once")
+    __parser.add_argument('--stream', action='store_true', help="async read by `async for`/stream()")
+    __parser.add_argument('--limit', type=int, default=0, help="in-memory queue ceiling, msgs (spill to disk)")
+    __parser.add_argument('--ceiling', type=int, default=0, help="in-memory container ceiling, MB (spill to disk)")
+    __parser.add_argument('--coalesce', type=float, default=0.0,
+                          help="async memory/RabbitMQ put() coalescing: max delay, µs (0: off)")
+    __parser.add_argument('--coalesce-n', type=int, default=COALESCE_N, help="put() coalescing: max msgs per flush")
+    __parser.add_argument('--pack', type=int, nargs='+', default=[0],
+                          help="messages per envelope (grid axis; 0: no packing)")
+    __parser.add_argument('--durability', type=Durability.parse, nargs='+', default=[None],
+                          metavar='none|os|<N>m|<T>ms|each',
+                          help="disk/RabbitMQ durability (grid axis): none, OS buffers, fsync per N msgs/T ms or each")
+    __parser.add_argument('--sim', action='store_true', help="use in-process RabbitMQ stand-in")
+    __parser.add_argument('--sim-delay', type=float, default=0.0, help="stand-in reply latency, s")
+    __parser.add_argument('--inproc', action='store_true',
+                          help="run all in this process (default: fresh process per backend run)")
+    __parser.add_argument('-o', '--out', help="result file: *.csv or JSON (default: JSON to stdout)")
+    __args = __parser.parse_args()
+    logging.basicConfig(format='%(message)s')  # log to stderr, rows to stdout
+    LOGGER.setLevel(logging.INFO)
+    __broker = Broker(delay=__args.sim_delay, queues=(f"{i:04d}" for i in range(max(__args.queues)))).start() \
+        if __args.sim else None
+    __coalesce = (__args.coalesce / 1e6, __args.coalesce_n) if __args.coalesce else None
+    __grid = [Workload(w, q, m, n, z, d, __args.burst, __args.gap) for w, q, m, n, z, d in itertools.product(
+        __args.writers, __args.queues, __args.msgs, __args.len, __args.zipf, __args.sizes)]
+    try:
+        __rows = run_work(
+            __grid, __args.backends, __args.consumers, __args.service, __args.prefetch, __broker,
+            [ConfirmMode[m] for m in __args.confirm or ('Each',)], __args.pool or (), __args.out, not __args.inproc
+        ) if __args.consumers else run_load(
+            __grid, __args.backends, __args.rate, __args.duration, __broker,
+            [ConfirmMode[m] for m in __args.confirm or ('Each',)], __args.consume, __args.pool or (), __args.out,
+            not __args.inproc, __coalesce
+        ) if __args.rate else run(
+            __grid,
+            __args.backends,
+            {'no': [False], 'yes': [True], 'both': [False, True]}[__args.batch],
+            __args.workers, __args.lat, __broker,
+            [ConfirmMode[m] for m in __args.confirm or ('Each',)],
+            __args.consume, __args.pool or (), __args.out, not __args.inproc, __args.ack, __args.stream,
+            (Limit(__args.limit), Limit(max_bytes=__args.ceiling << 20)) if __args.limit or __args.ceiling else None,
+            __coalesce, __args.pack, __args.durability
+        )
+    finally:
+        if __broker:
+            __broker.stop()
+    for __line in table(__rows):
+        LOGGER.info(__line)
+    if not __args.out:
+        write(__rows, None)
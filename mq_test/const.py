@@ -1,8 +1,72 @@
+# 1. std
+from typing import List
+from dataclasses import dataclass, field
+import itertools
+import random
+# 3. local
+from gen import Zipf, sizes
+# x. const
 W_COUNT = 1000  # prod: 1000
 Q_COUNT = 100   # prod: 100
 MSG_COUNT = 10  # prod: 1000
 R_COUNT = Q_COUNT
 MSG_LEN = 128
 MSG = b'\x00' * MSG_LEN
+BATCH_LEN = 100  # put_many()/get_many() chunk
+POOL_SIZE = 16  # thread/process pool size for concurrent writers/readers
+POOL_LEN = 1024  # distinct messages of variable size workloads
+# async RabbitMQ connections × channels: 1×1, channel per queue, connection per queue, middle
+TOPOLOGIES = ((1, 1), (1, Q_COUNT), (Q_COUNT, 1), (4, 4))
 # short: 1000 writers @ 100 queues = 10 w/q x 10 msgs = 100 queues x 100 msgs = 10k msgs
 # prod:  1000 writers @ 100 queues = 10 w/q x 1k msgs = 100 queues x 10k msgs = 1M msgs
+
+
+@dataclass
+class Workload:
+    """Test dimensions of one run."""
+    w_count: int = W_COUNT
+    q_count: int = Q_COUNT
+    msg_count: int = MSG_COUNT
+    msg_len: int = MSG_LEN  # mean if sizes vary
+    zipf: float = 0.0  # writers to queues: Zipf skew (0: round robin)
+    sizes: str = 'fixed'  # msg size distribution (gen.SIZE_DISTS)
+    burst: int = 0  # on/off writers: msgs per burst (0: no pauses)
+    gap: float = 0.0  # s, pause after each burst
+    seed: int = 0
+    msg: bytes = field(init=False, repr=False)
+    pool: List[bytes] = field(init=False, repr=False)  # messages to take from
+
+    def __post_init__(self):
+        self.msg = b'\x00' * self.msg_len
+        self.pool = [self.msg] if self.sizes == 'fixed' \
+            else [bytes(n) for n in itertools.islice(sizes(self.sizes, self.msg_len, self.seed), POOL_LEN)]
+
+    @property
+    def r_count(self) -> int:
+        return self.q_count  # reader per queue
+
+    def queue_ids(self, n: int) -> List[int]:
+        """Queue of each of n writers."""
+        if not self.zipf:
+            return [i % self.q_count for i in range(n)]
+        pick = Zipf(self.q_count, self.zipf, self.seed)
+        return [pick() for _ in range(n)]
+
+    def messages(self, n: int) -> List[bytes]:
+        """n messages of a writer."""
+        if len(self.pool) == 1:
+            return [self.msg] * n
+        start = random.randrange(len(self.pool))
+        return [self.pool[(start + i) % len(self.pool)] for i in range(n)]
+
+    def bursts(self, n: int) -> List[int]:
+        """Split n msgs of a writer into bursts."""
+        if not self.burst:
+            return [n]
+        return [min(self.burst, n - i) for i in range(0, n, self.burst)]
+
+    def __str__(self):
+        notes = ', '.join(filter(None, (f"zipf={self.zipf:g}" if self.zipf else None,
+                                        f"{self.sizes} sizes" if self.sizes != 'fixed' else None,
+                                        f"{self.burst}/{self.gap:g}s bursts" if self.burst else None)))
+        return f"{self.w_count} w @ {self.q_count} q × {self.msg_count} m" + (f" [{notes}]" if notes else '')
@@ -0,0 +1,41 @@
+"""Workload generators: skewed queue selection, message sizes, arrivals."""
+# 1. std
+from typing import Iterator, List
+import bisect
+import itertools
+import random
+# x. const
+SIZE_DISTS = ('fixed', 'uniform', 'exp')
+SIZE_CAP = 64  # exp: max size, × mean
+
+
+class Zipf:
+    """Ranks 0..n-1 with P(k) ∝ 1/(k+1)^s (rank 0 is the hottest)."""
+    __cum: List[float]
+    __rnd: random.Random
+
+    def __init__(self, n: int, s: float, seed: int = 0):
+        self.__cum = list(itertools.accumulate(1 / (k + 1) ** s for k in range(n)))
+        self.__rnd = random.Random(seed)
+
+    def __call__(self) -> int:
+        return bisect.bisect_left(self.__cum, self.__rnd.random() * self.__cum[-1])
+
+
+def sizes(dist: str, mean: int, seed: int = 0) -> Iterator[int]:
+    """Message sizes around mean.
+    :param dist: 'fixed', 'uniform' (1..2×mean-1) or 'exp' (exponential, capped by SIZE_CAP×mean)
+    """
+    rnd = random.Random(seed)
+    if dist == 'fixed':
+        return itertools.repeat(mean)
+    if dist == 'uniform':
+        return (rnd.randint(1, 2 * mean - 1) for _ in itertools.count())
+    if dist == 'exp':
+        return (min(max(1, round(rnd.expovariate(1 / mean))), SIZE_CAP * mean) for _ in itertools.count())
+    raise ValueError(f"Unknown size distribution: {dist}")
+
+
+def arrivals(rate: float, t0: float) -> Iterator[float]:
+    """Open-loop (constant rate) send times from t0, s."""
+    return (t0 + k / rate for k in itertools.count())
@@ -0,0 +1,247 @@
+"""Per-operation latency instrumentation.
+HDR-style histograms (log-linear buckets, ≤1% error) fed by `time.perf_counter_ns()`.
+"""
+# 1. std
+from typing import AsyncIterator, Dict, Tuple, List, Iterable, Optional
+import math
+import threading
+import time
+# 3. local
+from q import Delivery, QS, QA, STREAM_BATCH
+# x. const
+SUB_BITS = 7  # 128 sub-buckets per power of 2
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+_SUB = 1 << SUB_BITS
+_MASK = _SUB - 1
+
+
+class Hist:
+    """Latency histogram, ns."""
+    counts: Dict[int, int]  # bucket: count (sparse)
+    n: int
+    max: int
+
+    def __init__(self):
+        self.counts = {}
+        self.n = 0
+        self.max = 0
+
+    def record(self, v: int):
+        if v < _SUB:
+            i = v
+        else:
+            s = v.bit_length() - SUB_BITS - 1
+            i = ((s + 1) << SUB_BITS) | ((v >> s) & _MASK)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.n += 1
+        if v > self.max:
+            self.max = v
+
+    @staticmethod
+    def _value(i: int) -> int:
+        """Highest value of bucket."""
+        if i < _SUB:
+            return i
+        s = (i >> SUB_BITS) - 1
+        return (((i & _MASK) | _SUB) << s) + (1 << s) - 1
+
+    def merge(self, other: 'Hist'):
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.n += other.n
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> int:
+        rank = max(1, math.ceil(q * self.n))
+        acc = 0
+        for i in sorted(self.counts):
+            acc += self.counts[i]
+            if acc >= rank:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def __str__(self):
+        qs = ', '.join(f"p{q * 100:g}={_fmt(self.quantile(q))}" for q in QUANTILES)
+        return f"n={self.n}, {qs}, max={_fmt(self.max)}"
+
+
+def _fmt(ns: int) -> str:
+    if ns < 1_000_000:
+        return f"{ns / 1000:.1f}µs"
+    return f"{ns / 1_000_000:.1f}ms"
+
+
+HistDict = Dict[Tuple[str, str], Hist]  # (phase, op): histogram
+
+
+class Recorder:
+    """Histograms of all the proxies (one per writer/reader, so no locking on record)."""
+    __parts: List[Tuple[str, Dict[str, Hist]]]
+    __lock: threading.Lock
+
+    def __init__(self):
+        self.__parts = []
+        self.__lock = threading.Lock()
+
+    def hists(self, phase: str) -> Dict[str, Hist]:
+        """New per-proxy histograms {op: Hist} of phase."""
+        ret = {}
+        with self.__lock:
+            self.__parts.append((phase, ret))
+        return ret
+
+    def add(self, hists: HistDict):
+        """Add histograms collected elsewhere (e.g. in child process)."""
+        for (phase, op), h in hists.items():
+            self.hists(phase)[op] = h
+
+    def merged(self) -> HistDict:
+        ret: HistDict = {}
+        with self.__lock:
+            for phase, part in self.__parts:
+                for op, h in part.items():
+                    if (phase, op) not in ret:
+                        ret[phase, op] = Hist()
+                    ret[phase, op].merge(h)
+        return ret
+
+    def report(self) -> Iterable[str]:
+        for (phase, op), h in self.merged().items():
+            yield f"{phase}.{op}: {h}"
+
+
+class _Lat:
+    """Proxy base."""
+    _h: Dict[str, Hist]
+
+    def __init__(self, rec: Recorder, phase: str):
+        self._h = rec.hists(phase)
+
+    def _rec(self, op: str, t0: int):
+        dt = time.perf_counter_ns() - t0
+        if (h := self._h.get(op)) is None:
+            h = self._h[op] = Hist()
+        h.record(dt)
+
+
+class LatS(_Lat):
+    """Sync queue proxy recording per-call latency."""
+    __q: QS
+
+    def __init__(self, q: QS, rec: Recorder, phase: str):
+        super().__init__(rec, phase)
+        self.__q = q
+
+    def count(self) -> int:
+        t0 = time.perf_counter_ns()
+        ret = self.__q.count()
+        self._rec('count', t0)
+        return ret
+
+    def put(self, data: bytes):
+        t0 = time.perf_counter_ns()
+        self.__q.put(data)
+        self._rec('put', t0)
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        t0 = time.perf_counter_ns()
+        ret = self.__q.get(wait)
+        self._rec('get', t0)
+        return ret
+
+    def get_all(self):
+        t0 = time.perf_counter_ns()
+        self.__q.get_all()
+        self._rec('get_all', t0)
+
+    def put_many(self, data: Iterable[bytes]):
+        t0 = time.perf_counter_ns()
+        self.__q.put_many(data)
+        self._rec('put_many', t0)
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        t0 = time.perf_counter_ns()
+        ret = self.__q.get_many(max_n)
+        self._rec('get_many', t0)
+        return ret
+
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        t0 = time.perf_counter_ns()
+        ret = self.__q.get_ack(wait)
+        self._rec('get_ack', t0)
+        return ret
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        t0 = time.perf_counter_ns()
+        self.__q.ack(d, multiple)
+        self._rec('ack', t0)
+
+
+class LatA(_Lat):
+    """Async queue proxy recording per-call latency (including event loop scheduling)."""
+    __q: QA
+
+    def __init__(self, q: QA, rec: Recorder, phase: str):
+        super().__init__(rec, phase)
+        self.__q = q
+
+    async def count(self) -> int:
+        t0 = time.perf_counter_ns()
+        ret = await self.__q.count()
+        self._rec('count', t0)
+        return ret
+
+    async def put(self, data: bytes):
+        t0 = time.perf_counter_ns()
+        await self.__q.put(data)
+        self._rec('put', t0)
+
+    async def get(self, wait: bool = True) -> Optional[bytes]:
+        t0 = time.perf_counter_ns()
+        ret = await self.__q.get(wait)
+        self._rec('get', t0)
+        return ret
+
+    async def get_all(self):
+        t0 = time.perf_counter_ns()
+        await self.__q.get_all()
+        self._rec('get_all', t0)
+
+    async def put_many(self, data: Iterable[bytes]):
+        t0 = time.perf_counter_ns()
+        await self.__q.put_many(data)
+        self._rec('put_many', t0)
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        t0 = time.perf_counter_ns()
+        ret = await self.__q.get_many(max_n)
+        self._rec('get_many', t0)
+        return ret
+
+    async def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        t0 = time.perf_counter_ns()
+        ret = await self.__q.get_ack(wait)
+        self._rec('get_ack', t0)
+        return ret
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        t0 = time.perf_counter_ns()
+        await self.__q.ack(d, multiple)
+        self._rec('ack', t0)
+
+    async def __timed(self, op: str, it: AsyncIterator) -> AsyncIterator:
+        """Items of it, each one's wait recorded as op (consumer's time between items excluded)."""
+        while True:
+            t0 = time.perf_counter_ns()
+            try:
+                item = await it.__anext__()
+            except StopAsyncIteration:
+                return
+            self._rec(op, t0)
+            yield item
+
+    def stream(self, batch: int = STREAM_BATCH) -> AsyncIterator[List[bytes]]:
+        return self.__timed('stream', self.__q.stream(batch).__aiter__())
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.__timed('next', self.__q.__aiter__())
@@ -4,24 +4,41 @@
 - RabbitMQ-/disk-/memory-based.
 - K(10) queues × L(10..1000) writers × M(10) readers/writers × N(1...1000) messages (128 bytes)
 """
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Optional, Callable, ContextManager, Iterable, Union, Awaitable
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
+import threading
 import time
 import platform
+import struct
 import logging
 import asyncio
 # 2. 3rd
 import psutil
 # 3. local
 # from . import ...  # not works for main.py
-from const import Q_COUNT, W_COUNT, MSG_COUNT, R_COUNT, MSG
-from q import QSc, QS, QAc, Qc
+from const import Q_COUNT, BATCH_LEN, POOL_SIZE, TOPOLOGIES, Workload
+from q import COALESCE_N, QExc, LockScope, Durability, Limit, QStats, QSc, QS, QAc, QA, Qc
+from lat import QUANTILES, Hist, Recorder, HistDict, LatS, LatA
+from gen import arrivals
 from qsm import QSMC
 from qsd1 import QSD1c
 from qsd2 import QSD2c
+from qsd3 import QSD3c
+from qsd4 import QSD4c
+from qss import QSSc, ring_size
+from qsh import QSHc, QAHc
 from qsr1 import QSRc
 from qam import QAMc
-from qar1 import QAR1c
+from qad1 import QAD1c
+from qar1 import QAR1c, ConfirmMode
 from qar2 import QAR2c
+from pack import PackSc, PackAc
+from rqsim import Broker
 
 # x. const
 if platform.system() == 'Darwin':
@@ -39,6 +56,14 @@ if platform.system() == 'Darwin':
     LOGGER = Logger()
 else:
     LOGGER = logging.getLogger(__name__)
+S_BACKENDS = ('qsm', 'qsd1', 'qsd2', 'qsd3', 'qsd4', 'qss', 'qsh', 'qsr1')
+A_BACKENDS = ('qam', 'qad1', 'qah', 'qar1', 'qar2')
+Row = Dict[str, Union[str, int, float, bool]]  # test run result
+RSS_TICK = 0.01  # s, RSS sampling period of isolated runs
+LOAD_TIME = 5.0  # s, open-loop run
+POLL_TICK = 0.001  # s, open-loop reader pause on empty queue
+_STAMP = struct.Struct('<d')  # open-loop message head: scheduled send time (perf_counter)
+DEPTH_TICK = 0.1  # s, worker pool: queue depth sampling period
 
 
 def _mem_used() -> int:
@@ -46,102 +71,783 @@ def _mem_used() -> int:
     return round(psutil.Process().memory_info().rss / (1 << 20))
 
 
-def _title(qc: Qc):
-    LOGGER.info(f"== {qc.title} {W_COUNT} w @ {Q_COUNT} q × {MSG_COUNT} m ==")
+def _title(qc: Qc, wl: Workload, batch: bool = False, workers: Optional[str] = None, ack: bool = False,
+           stream: bool = False):
+    notes = ', '.join(filter(None, ('batch' if batch else None, workers, 'ack' if ack else None,
+                                    'stream' if stream else None,
+                                    f"durability={qc.durability}" if qc.durability else None)))
+    LOGGER.info(f"== {qc.title} {wl}{f' ({notes})' if notes else ''} ==")
+
+
+def _row(qc: Qc, wl: Workload, batch: bool, workers: Optional[str], t: List[float], m: List[int], left: int,
+         ack: bool = False, stream: bool = False, wire: Optional[QStats] = None) -> Row:
+    """Test run result.
+    :param t: timestamps: start, writers/readers created, put done, get done
+    :param m: RSS, MB, at the same points
+    :param left: messages not got
+    :param wire: what the backend got to keep (envelopes if packed; unknown if put in other processes)
+    """
+    n = wl.w_count * wl.msg_count
+    t_put, t_get = t[2] - t[1], t[3] - t[2]
+    return {
+        'backend': qc.title, 'batch': batch, 'workers': workers or '', 'ack': ack, 'stream': stream,
+        'writers': wl.w_count, 'queues': wl.q_count, 'msgs': wl.msg_count, 'msg_len': wl.msg_len,
+        'zipf': wl.zipf, 'sizes': wl.sizes, 'burst': wl.burst, 'gap': wl.gap,
+        't_init': round(t[1] - t[0], 4), 't_put': round(t_put, 4), 't_get': round(t_get, 4),
+        'put_rate': round(n / t_put) if t_put > 0 else 0, 'get_rate': round(n / t_get) if t_get > 0 else 0,
+        'rss': m[0], 'rss_put': m[2] - m[0], 'rss_get': m[3] - m[0],
+        'durability': str(qc.durability or ''), 'pack': qc.pack_n if isinstance(qc, (PackSc, PackAc)) else 0,
+        'wire_msgs': wire.n_put if wire else '', 'wire_bytes': wire.b_put if wire else '',
+        'left': left,
+    }
+
+
+def _spread(done: List[Tuple[int, float]], q_msgs: List[int]) -> str:
+    """Aggregate throughput and per-queue fairness (Jain's index).
+    :param done: (queue id, finish time since phase start) per writer/reader
+    :param q_msgs: messages per queue
+    """
+    last: Dict[int, float] = {}
+    for i, t in done:
+        last[i] = max(last.get(i, 0.0), t)
+    rates = [q_msgs[i] / t for i, t in last.items() if t > 0 and q_msgs[i]]
+    if not rates:
+        return "rate=n/a"
+    jain = sum(rates) ** 2 / (len(rates) * sum(r * r for r in rates))
+    return f"rate={round(sum(q_msgs) / max(last.values()))}/s, fair={jain:.3f}, " \
+           f"q_rate={round(min(rates))}…{round(max(rates))}/s"
 
 
 # == Sync ==
-def stest(sqc: QSc):
-    """Sync."""
-    _title(sqc)
-    sqc.open(Q_COUNT)
+def _swrite(w: QS, wl: Workload, batch: bool, lock: ContextManager):
+    """Writer job."""
+    msgs = wl.messages(wl.msg_count)
+    i = 0
+    for n in wl.bursts(wl.msg_count):
+        if i:
+            time.sleep(wl.gap)
+        if batch:
+            with lock:
+                w.put_many(msgs[i:i + n])
+        else:
+            for msg in msgs[i:i + n]:
+                with lock:
+                    w.put(msg)
+        i += n
+
+
+def _sread(r: QS, _: Workload, batch: bool, lock: ContextManager, ack: bool = False):
+    """Reader job.
+    :param ack: get_ack() each, ack(multiple) each BATCH_LEN
+    """
+    if ack:
+        n, last = 0, None
+        while True:
+            with lock:
+                if (d := r.get_ack(False)) is None:
+                    break
+                n += 1
+                if n % BATCH_LEN == 0:
+                    r.ack(d, multiple=True)
+            last = d
+        if last and n % BATCH_LEN:
+            with lock:
+                r.ack(last, multiple=True)
+    elif batch:
+        while True:
+            with lock:
+                if not r.get_many(BATCH_LEN):
+                    break
+    else:
+        with lock:
+            r.get_all()
+        # for _ in r:
+        #    ...
+
+
+def _slocks(sqc: QSc, n: int) -> List[ContextManager]:
+    """Locks by queue id according to container thread-safety."""
+    if sqc.lock_scope == LockScope.No:
+        return [contextlib.nullcontext()] * n
+    if sqc.lock_scope == LockScope.Queue:
+        return [threading.Lock() for _ in range(n)]
+    return [threading.Lock()] * n
+
+
+def _sproc(sqc: QSc, wl: Workload, jobs: List[int], job: Callable, batch: bool, phase: Optional[str]) \
+        -> Tuple[List[Tuple[int, float]], Optional[HistDict]]:
+    """Process pool job: own container, queues by id (repeated per writer/reader).
+    :param phase: record latencies of the phase if set
+    :return: (queue id, finish timestamp) pairs, latency histograms
+    """
+    ret = []
+    rec = Recorder() if phase else None
+    sqc.open(wl.q_count)
+    for i in jobs:
+        job(LatS(sqc.q(i), rec, phase) if rec else sqc.q(i), wl, batch, contextlib.nullcontext())
+        ret.append((i, time.time()))
+    sqc.close()
+    return ret, rec.merged() if rec else None
+
+
+def _srun(sqc: QSc, wl: Workload, q_list: List[QS], ids: List[int], job: Callable, batch: bool,
+          workers: Optional[str], rec: Optional[Recorder], phase: str) -> List[Tuple[int, float]]:
+    """Run writers/readers sequentially or concurrently.
+    :param rec: latency recorder (if any)
+    :return: (queue id, finish time since phase start) pairs
+    """
+    t0 = time.time()
+    if workers == 'process':  # one process per group of queues
+        n = min(POOL_SIZE, wl.q_count)
+        with concurrent.futures.ProcessPoolExecutor(n) as pool:
+            parts = pool.map(_sproc, [sqc] * n, [wl] * n, [[i for i in ids if i % n == k] for k in range(n)], [job] * n,
+                             [batch] * n, [phase if rec else None] * n)
+            ret = []
+            for done, hists in parts:
+                ret.extend((i, t - t0) for i, t in done)
+                if hists:
+                    rec.add(hists)
+            return ret
+    if rec:
+        q_list = [LatS(q, rec, phase) for q in q_list]
+    locks = _slocks(sqc, wl.q_count)
+    if workers == 'thread':
+        def __job(__q: QS, __i: int) -> Tuple[int, float]:
+            job(__q, wl, batch, locks[__i])
+            return __i, time.time() - t0
+        with concurrent.futures.ThreadPoolExecutor(POOL_SIZE) as pool:
+            return list(pool.map(__job, q_list, ids))
+    ret = []
+    for q, i in zip(q_list, ids):
+        job(q, wl, batch, locks[i])
+        ret.append((i, time.time() - t0))
+    return ret
+
+
+def _lat_report(rec: Optional[Recorder]):
+    if rec:
+        for line in rec.report():
+            LOGGER.info(f"   {line}")
+
+
+def stest(sqc: QSc, batch: bool = False, workers: Optional[str] = None, lat: bool = False,
+          wl: Optional[Workload] = None, ack: bool = False) -> Row:
+    """Sync.
+    :param batch: use put_many()/get_many() instead of put()/get_all()
+    :param workers: run writers/readers concurrently: None (sequentially), 'thread' or 'process'
+    :param lat: record per-call latencies
+    :param wl: test dimensions (default: from const)
+    :param ack: read by get_ack()/ack()
+    """
+
+    def __counters() -> List[int]:
+        if workers == 'process':  # queue states changed outside, reopen
+            sqc.open(wl.q_count)
+        return [st.depth for st in sqc.stats()]
+
+    wl = wl or Workload()
+    _title(sqc, wl, batch, workers, ack)
+    rec = Recorder() if lat else None
+    if workers == 'process' and not sqc.shared:
+        raise QExc(f"{sqc.title}: not available from other processes")
+    mem = [_mem_used()]
+    sqc.open(wl.q_count)
     t0 = time.time()
+    ts = [t0]
     # 0. create writers and readers
-    w_list: List[QS] = [sqc.q(i % Q_COUNT) for i in range(W_COUNT)]  # - writers
-    r_list: List[QS] = [sqc.q(i % Q_COUNT) for i in range(R_COUNT)]  # - readers
-    LOGGER.info(f"1: m={_mem_used()}, t={round(time.time() - t0, 2)}, Wrtrs: {len(w_list)}, Rdrs: {len(r_list)}")
+    w_ids = wl.queue_ids(wl.w_count)
+    r_ids = [i % wl.q_count for i in range(wl.r_count)]
+    w_list: List[QS] = [sqc.q(i) for i in w_ids]  # - writers
+    r_list: List[QS] = [sqc.q(i) for i in r_ids]  # - readers
+    mem.append(_mem_used())
+    ts.append(time.time())
+    LOGGER.info(f"1: m={mem[-1]}, t={round(ts[-1] - t0, 2)}, Wrtrs: {len(w_list)}, Rdrs: {len(r_list)}")
+    if workers == 'process':  # let children own the queues
+        sqc.close()
     # 1. put
-    for w in w_list:
-        for _ in range(MSG_COUNT):
-            w.put(MSG)
-    m_count = [sqc.q(i).count() for i in range(Q_COUNT)]
+    done = _srun(sqc, wl, w_list, w_ids, _swrite, batch, workers, rec, 'put')
+    ts.append(time.time())
+    mem.append(_mem_used())
+    m_count = __counters()
     s_count = sum(m_count)
-    LOGGER.info(f"2: m={_mem_used()}, t={round(time.time() - t0, 2)}, msgs={s_count}")
+    LOGGER.info(f"2: m={mem[-1]}, t={round(time.time() - t0, 2)}, msgs={s_count}, {_spread(done, m_count)}")
     # if s_count:
     #    print("Msgs: {m_count}")
     # 2. get
-    for r in r_list:
-        r.get_all()
-        # for _ in r:
-        #    ...
+    if workers == 'process':
+        sqc.close()
+    done = _srun(sqc, wl, r_list, r_ids, functools.partial(_sread, ack=True) if ack else _sread, batch, workers, rec,
+                 'get')
+    ts.append(time.time())
+    mem.append(_mem_used())
     # x. the end
-    m_count = [sqc.q(i).count() for i in range(Q_COUNT)]
+    r_count = m_count
+    m_count = __counters()
     s_count = sum(m_count)
-    LOGGER.info(f"3: m={_mem_used()}, t={round(time.time() - t0, 2)}, msgs={s_count}")
+    LOGGER.info(f"3: m={mem[-1]}, t={round(time.time() - t0, 2)}, msgs={s_count}, {_spread(done, r_count)}")
     if s_count:
         print(f"Msgs: {m_count}")
+    wire = None
+    if workers != 'process':  # else counted by children
+        st = QStats.total(sqc.stats())
+        wire = QStats.total(sqc.inner.stats()) if isinstance(sqc, PackSc) else st
+        LOGGER.info(f"Stats: {st}" + (f", wire: {wire}" if wire is not st else ''))
+    _lat_report(rec)
     sqc.close()
+    return _row(sqc, wl, batch, workers, ts, mem, s_count, ack, wire=wire)
 
 
 # == async ==
-async def atest(aqc: QAc, bulk_tx=True, bulk_rx=True):
-    """Async."""
+async def atest(aqc: QAc, bulk_tx=True, bulk_rx=True, batch: bool = False, lat: bool = False,
+                wl: Optional[Workload] = None, ack: bool = False, stream: bool = False) -> Row:
+    """Async.
+    :param batch: use put_many()/get_many() instead of put()/get_all()
+    :param lat: record per-call latencies
+    :param wl: test dimensions (default: from const)
+    :param ack: read by get_ack()/ack(multiple) each BATCH_LEN
+    :param stream: read by `async for` (batch: by stream() chunks)
+    """
+
+    async def __drain(__q: QA):
+        while await __q.get_many(BATCH_LEN):
+            ...
+
+    async def __drain_ack(__q: QA):
+        __n, __last = 0, None
+        while (__d := await __q.get_ack(False)) is not None:
+            __n += 1
+            if __n % BATCH_LEN == 0:
+                await __q.ack(__d, multiple=True)
+            __last = __d
+        if __last and __n % BATCH_LEN:
+            await __q.ack(__last, multiple=True)
+
+    async def __stream(__q: QA):
+        if batch:
+            async for _ in __q.stream(BATCH_LEN):
+                ...
+        else:
+            async for _ in __q:
+                ...
+
+    def __reader(__q: QA) -> Awaitable:
+        if ack:
+            return __drain_ack(__q)
+        if stream:
+            return __stream(__q)
+        return __drain(__q) if batch else __q.get_all()
 
     async def __counters() -> Tuple[int]:
-        __qs = await asyncio.gather(*[aqc.q(i) for i in range(Q_COUNT)])
-        __count = await asyncio.gather(*[__q.count() for __q in __qs])
-        return tuple(map(int, __count))
+        return tuple(st.depth for st in await aqc.stats())
 
-    _title(aqc)
-    await aqc.open(Q_COUNT)
+    wl = wl or Workload()
+    _title(aqc, wl, batch, ack=ack, stream=stream)
+    rec = Recorder() if lat else None
+    mem = [_mem_used()]
+    await aqc.open(wl.q_count)
     t0 = time.time()
+    ts = [t0]
     # 0. create writers and readers
-    w_list = await asyncio.gather(*[aqc.q(i % Q_COUNT) for i in range(W_COUNT)])  # - writers
-    r_list = await asyncio.gather(*[aqc.q(i % Q_COUNT) for i in range(R_COUNT)])  # - readers
-    LOGGER.info(f"1: m={_mem_used()}, t={round(time.time() - t0, 2)}, Wrtrs: {len(w_list)}, Rdrs: {len(r_list)}")
-    # 1. put (MSG_COUNT times all the writers)
-    for _ in range(MSG_COUNT):
-        if bulk_tx:
-            await asyncio.gather(*[w.put(MSG) for w in w_list])
+    w_list = await asyncio.gather(*[aqc.q(i) for i in wl.queue_ids(wl.w_count)])  # - writers
+    r_list = await asyncio.gather(*[aqc.q(i % wl.q_count) for i in range(wl.r_count)])  # - readers
+    mem.append(_mem_used())
+    ts.append(time.time())
+    LOGGER.info(f"1: m={mem[-1]}, t={round(ts[-1] - t0, 2)}, Wrtrs: {len(w_list)}, Rdrs: {len(r_list)}")
+    if rec:
+        w_list = [LatA(w, rec, 'put') for w in w_list]
+        r_list = [LatA(r, rec, 'get') for r in r_list]
+    # 1. put (msg_count times all the writers; bursts: all the writers pause together)
+    msgs = [wl.messages(wl.msg_count) for _ in w_list]
+    i = 0
+    for n in wl.bursts(wl.msg_count):
+        if i:
+            await asyncio.sleep(wl.gap)
+        if batch:
+            await asyncio.gather(*[w.put_many(m[i:i + n]) for w, m in zip(w_list, msgs)])
         else:
-            for w in w_list:
-                await w.put(MSG)
+            for k in range(i, i + n):
+                if bulk_tx:
+                    await asyncio.gather(*[w.put(m[k]) for w, m in zip(w_list, msgs)])
+                else:
+                    for w, m in zip(w_list, msgs):
+                        await w.put(m[k])
+        i += n
+    await aqc.flush()
+    ts.append(time.time())
+    mem.append(_mem_used())
     # RAW err
     m_count = await __counters()
     s_count = sum(m_count)
-    LOGGER.info(f"2: m={_mem_used()}, t={round(time.time() - t0, 2)}, msgs={s_count}")
+    LOGGER.info(f"2: m={mem[-1]}, t={round(time.time() - t0, 2)}, msgs={s_count}")
     # 2. get
-    await asyncio.gather(*[r.get_all() for r in r_list])
+    await asyncio.gather(*[__reader(r) for r in r_list])
+    ts.append(time.time())
+    mem.append(_mem_used())
     # x. the end
     m_count = await __counters()
     s_count = sum(m_count)
-    LOGGER.info(f"3: m={_mem_used()}, t={round(time.time() - t0, 2)}, msgs={s_count}")
+    LOGGER.info(f"3: m={mem[-1]}, t={round(time.time() - t0, 2)}, msgs={s_count}")
     if s_count:
         LOGGER.info(f"Msgs: {m_count}")
+    st = QStats.total(await aqc.stats())
+    wire = QStats.total(await aqc.inner.stats()) if isinstance(aqc, PackAc) else st
+    LOGGER.info(f"Stats: {st}" + (f", wire: {wire}" if wire is not st else ''))
+    _lat_report(rec)
+    await aqc.close()
+    return _row(aqc, wl, batch, None, ts, mem, s_count, ack, stream, wire)
+
+
+# == open loop ==
+def _load_row(qc: Qc, wl: Workload, rate: float, sent: int, t: float, hists: Iterable[Hist], left: int) -> Row:
+    """Open-loop run result: offered vs achieved rate, end-to-end latency, µs.
+    :param t: time from the 1st send to the last get, s
+    """
+    h = Hist()
+    for part in hists:
+        h.merge(part)
+    LOGGER.info(f"   offered={rate:g}/s, sent={sent}, got={h.n}, t={t:.2f}s, lat: {h}")
+    return {
+        'backend': qc.title, 'queues': wl.q_count, 'msg_len': wl.msg_len, 'zipf': wl.zipf, 'sizes': wl.sizes,
+        'rate': rate, 'sent': sent, 'got': h.n, 'achieved': round(h.n / t) if t > 0 else 0,
+        **{f"p{q * 100:g}": round(h.quantile(q) / 1000) for q in QUANTILES}, 'lat_max': round(h.max / 1000),
+        'left': left,
+    }
+
+
+def sload(sqc: QSc, rate: float, duration: float = LOAD_TIME, wl: Optional[Workload] = None) -> Row:
+    """Sync open loop: messages are sent at `rate` whatever the queues do, a reader thread per queue drains them.
+    Latency counts from the scheduled send time, so a stalled backend is charged for the backlog
+    (no coordinated omission).
+    :param wl: queues, message sizes, Zipf skew (writers and msgs: not used)
+    """
+    wl = wl or Workload()
+    n = round(rate * duration)
+    LOGGER.info(f"== {sqc.title} {wl} @ {rate:g} msg/s × {duration:g}s (open loop) ==")
+    sqc.open(wl.q_count)
+    qs = [sqc.q(i) for i in range(wl.q_count)]
+    locks = _slocks(sqc, wl.q_count)
+    q_ids = wl.queue_ids(n)
+    msgs = wl.messages(n)
+    hists = [Hist() for _ in qs]
+    stop = threading.Event()
+
+    def __read(i: int):
+        q, h, lock = qs[i], hists[i], locks[i]
+        while True:
+            with lock:
+                got = q.get_many(BATCH_LEN)
+            now = time.perf_counter()
+            for msg in got:
+                h.record(round((now - _STAMP.unpack_from(msg)[0]) * 1e9))
+            if not got:
+                if stop.is_set():
+                    break
+                time.sleep(POLL_TICK)
+
+    readers = [threading.Thread(target=__read, args=(i,), daemon=True) for i in range(wl.q_count)]
+    for th in readers:
+        th.start()
+    t0 = time.perf_counter()
+    for at, i, msg in zip(arrivals(rate, t0), q_ids, msgs):
+        if (d := at - time.perf_counter()) > 0:
+            time.sleep(d)
+        with locks[i]:
+            qs[i].put(_STAMP.pack(at) + msg[_STAMP.size:])
+    stop.set()
+    for th in readers:
+        th.join()
+    t = time.perf_counter() - t0
+    left = sum(q.count() for q in qs)
+    sqc.close()
+    return _load_row(sqc, wl, rate, n, t, hists, left)
+
+
+async def aload(aqc: QAc, rate: float, duration: float = LOAD_TIME, wl: Optional[Workload] = None) -> Row:
+    """Async open loop (see sload()): sender and reader per queue are tasks of one event loop."""
+    wl = wl or Workload()
+    n = round(rate * duration)
+    LOGGER.info(f"== {aqc.title} {wl} @ {rate:g} msg/s × {duration:g}s (open loop) ==")
+    await aqc.open(wl.q_count)
+    qs = await asyncio.gather(*[aqc.q(i) for i in range(wl.q_count)])
+    q_ids = wl.queue_ids(n)
+    msgs = wl.messages(n)
+    hists = [Hist() for _ in qs]
+    stop = asyncio.Event()
+
+    async def __read(i: int):
+        q, h = qs[i], hists[i]
+        while True:
+            got = await q.get_many(BATCH_LEN)
+            now = time.perf_counter()
+            for msg in got:
+                h.record(round((now - _STAMP.unpack_from(msg)[0]) * 1e9))
+            if not got:
+                if stop.is_set():
+                    break
+                await asyncio.sleep(POLL_TICK)
+
+    readers = [asyncio.create_task(__read(i)) for i in range(wl.q_count)]
+    pending = set()
+    t0 = time.perf_counter()
+    for at, i, msg in zip(arrivals(rate, t0), q_ids, msgs):
+        await asyncio.sleep(max(0.0, at - time.perf_counter()))  # yield to readers even if late
+        task = asyncio.create_task(qs[i].put(_STAMP.pack(at) + msg[_STAMP.size:]))  # do not wait for the broker
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+    await aqc.flush()
+    stop.set()
+    await asyncio.gather(*readers)
+    t = time.perf_counter() - t0
+    left = sum(await asyncio.gather(*[q.count() for q in qs]))
+    await aqc.close()
+    return _load_row(aqc, wl, rate, n, t, hists, left)
+
+
+def _aload_run(aqc: QAc, **kwargs) -> Row:
+    return asyncio.run(aload(aqc, **kwargs))
+
+
+# == worker pool ==
+def _work_row(qc: Qc, wl: Workload, consumers: int, service: float, prefetch: int, t: float,
+              done: List[Tuple[float, int]], depth: List[int], left: int) -> Row:
+    """Worker pool run result.
+    :param done: (busy time, messages) per consumer
+    :param depth: all queues depth sampled each DEPTH_TICK
+    """
+    n = sum(m for _, m in done)
+    util = sum(b for b, _ in done) / (len(done) * t) if t > 0 else 0
+    LOGGER.info(f"   t={t:.2f}s, msgs={n}, rate={round(n / t) if t > 0 else 0}/s, util={util:.3f}, "
+                f"depth: {' '.join(map(str, depth))}")
+    return {
+        'backend': qc.title, 'writers': wl.w_count, 'queues': wl.q_count, 'msgs': wl.msg_count,
+        'msg_len': wl.msg_len, 'consumers': consumers, 'service': service, 'prefetch': prefetch,
+        't_work': round(t, 4), 'work_rate': round(n / t) if t > 0 else 0, 'util': round(util, 3),
+        'depth': depth, 'left': left,
+    }
+
+
+def swork(sqc: QSc, consumers: int = 1, service: float = 0.001, prefetch: int = 1,
+          wl: Optional[Workload] = None) -> Row:
+    """Sync worker pool: queues are filled, then competing consumers (threads) drain them doing "work".
+    A consumer takes up to `prefetch` messages by get_ack(), sleeps `service` per message, acks them.
+    Measures throughput, consumer utilization (busy / elapsed) and queue depth over time.
+    :param consumers: per queue
+    :param service: s per message
+    :note: one consumer per queue acks by `multiple`; competing ones ack each message (multiple would cover
+        deliveries of the others: shared queue object or channel)
+    """
+    wl = wl or Workload()
+    LOGGER.info(f"== {sqc.title} {wl} → {consumers} × {service * 1000:g} ms, prefetch={prefetch} (workers) ==")
+    sqc.open(wl.q_count)
+    qs = [sqc.q(i) for i in range(wl.q_count)]
+    locks = _slocks(sqc, wl.q_count)
+    w_ids = wl.queue_ids(wl.w_count)
+    _srun(sqc, wl, [qs[i] for i in w_ids], w_ids, _swrite, True, None, None, 'put')
+    depth = []
+    stop = threading.Event()
+
+    def __sample():
+        while True:
+            n = 0
+            for q, lock in zip(qs, locks):
+                with lock:
+                    n += q.count()
+            depth.append(n)
+            if stop.wait(DEPTH_TICK):
+                break
+
+    def __work(i: int) -> Tuple[float, int]:
+        q, lock = qs[i], locks[i]
+        busy, n = 0.0, 0
+        while True:
+            with lock:
+                got = []
+                while len(got) < prefetch and (d := q.get_ack(False)) is not None:
+                    got.append(d)
+            if not got:
+                return busy, n
+            t = time.perf_counter()
+            for _ in got:
+                time.sleep(service)
+            busy += time.perf_counter() - t
+            with lock:
+                if consumers == 1:
+                    q.ack(got[-1], multiple=True)
+                else:
+                    for d in got:
+                        q.ack(d, False)
+            n += len(got)
+
+    sampler = threading.Thread(target=__sample, daemon=True)
+    sampler.start()
+    t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(wl.q_count * consumers) as pool:
+        done = list(pool.map(__work, [i for i in range(wl.q_count) for _ in range(consumers)]))
+    t = time.perf_counter() - t0
+    stop.set()
+    sampler.join()
+    left = sum(q.count() for q in qs)
+    sqc.close()
+    return _work_row(sqc, wl, consumers, service, prefetch, t, done, depth, left)
+
+
+async def awork(aqc: QAc, consumers: int = 1, service: float = 0.001, prefetch: int = 1,
+                wl: Optional[Workload] = None) -> Row:
+    """Async worker pool (see swork()): consumers are tasks, "work" is asyncio.sleep()."""
+    wl = wl or Workload()
+    LOGGER.info(f"== {aqc.title} {wl} → {consumers} × {service * 1000:g} ms, prefetch={prefetch} (workers) ==")
+    await aqc.open(wl.q_count)
+    qs = await asyncio.gather(*[aqc.q(i) for i in range(wl.q_count)])
+    await asyncio.gather(*[qs[i].put_many(wl.messages(wl.msg_count)) for i in wl.queue_ids(wl.w_count)])
+    await aqc.flush()
+    depth = []
+    stop = asyncio.Event()
+
+    async def __sample():
+        while True:
+            depth.append(sum(st.depth for st in await aqc.stats()))
+            try:
+                await asyncio.wait_for(stop.wait(), DEPTH_TICK)
+                break
+            except asyncio.TimeoutError:
+                ...
+
+    async def __work(q: QA) -> Tuple[float, int]:
+        busy, n = 0.0, 0
+        while True:
+            got = []
+            while len(got) < prefetch and (d := await q.get_ack(False)) is not None:
+                got.append(d)
+            if not got:
+                return busy, n
+            t = time.perf_counter()
+            for _ in got:
+                await asyncio.sleep(service)
+            busy += time.perf_counter() - t
+            if consumers == 1:
+                await q.ack(got[-1], multiple=True)
+            else:
+                for d in got:
+                    await q.ack(d, False)
+            n += len(got)
+
+    sampler = asyncio.create_task(__sample())
+    t0 = time.perf_counter()
+    done = await asyncio.gather(*[__work(q) for q in qs for _ in range(consumers)])
+    t = time.perf_counter() - t0
+    stop.set()
+    await sampler
+    left = sum(await asyncio.gather(*[q.count() for q in qs]))
     await aqc.close()
+    return _work_row(aqc, wl, consumers, service, prefetch, t, done, depth, left)
+
+
+def _awork_run(aqc: QAc, **kwargs) -> Row:
+    return asyncio.run(awork(aqc, **kwargs))
+
+
+# == isolation ==
+def _arun(aqc: QAc, **kwargs) -> Row:
+    return asyncio.run(atest(aqc, **kwargs))
+
+
+def _isolated_job(test: Callable[..., Row], qc: Qc, kwargs: Dict, level: int) -> Row:
+    """Child process side: run test sampling RSS.
+    :param level: parent's log level
+    """
+    if isinstance(LOGGER, logging.Logger):
+        logging.basicConfig(format='%(message)s')
+        LOGGER.setLevel(level)
+    proc = psutil.Process()
+    base = peak = proc.memory_info().rss
+    stop = threading.Event()
+
+    def __sample():
+        nonlocal peak
+        while not stop.wait(RSS_TICK):
+            peak = max(peak, proc.memory_info().rss)
+
+    sampler = threading.Thread(target=__sample, daemon=True)
+    sampler.start()
+    try:
+        ret = test(qc, **kwargs)
+    finally:
+        stop.set()
+        sampler.join()
+    end = proc.memory_info().rss
+    ret.update(rss_base=round(base / (1 << 20)), rss_peak=round(max(peak, end) / (1 << 20)),
+               rss_close=round(end / (1 << 20)))
+    return ret
+
+
+def isolated(test: Callable[..., Row], qc: Qc, **kwargs) -> Row:
+    """Run test(qc, **kwargs) in a fresh interpreter (spawn, not fork: nothing inherited from previous runs).
+    Adds RSS, MB: baseline (imports only), peak (sampled every RSS_TICK), post-close.
+    """
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        level = LOGGER.getEffectiveLevel() if isinstance(LOGGER, logging.Logger) else logging.INFO
+        return pool.submit(_isolated_job, test, qc, kwargs, level).result()
 
 
 # == entry points ==
-def smain():
-    """Sync."""
-    stest(QSMC())
-    stest(QSD1c())
-    stest(QSD2c())
-    stest(QSRc())  # remote: 'hostname'
+def s_containers(backends: Optional[Iterable[str]] = None, broker: Optional[Broker] = None, consume: bool = False,
+                 limits: Optional[Tuple[Limit, Limit]] = None, pack: int = 0,
+                 durability: Optional[Durability] = None, wl: Optional[Workload] = None) -> List[QSc]:
+    """Sync containers to test.
+    :param backends: S_BACKENDS names (default: all)
+    :param broker: stand-in RabbitMQ (if any)
+    :param consume: RabbitMQ get_all() by consumer instead of basic_get polling
+    :param limits: in-memory queue/container ceilings (with spill to disk: put and get phases do not overlap)
+    :param pack: messages per envelope (0: no packing)
+    :param durability: disk/RabbitMQ backends' durability policy (default: theirs)
+    :param wl: test dimensions to size shared memory rings for (all msgs of a queue put before got)
+    """
+    sqcs: Dict[str, Callable[[], QSc]] = {
+        'qsm': lambda: QSMC(*limits, spill=QSD3c()) if limits else QSMC(),
+        'qsd1': lambda: QSD1c(durability),
+        'qsd2': lambda: QSD2c(durability),
+        'qsd3': lambda: QSD3c(durability=durability),
+        'qsd4': lambda: QSD4c(durability=durability),
+        'qss': lambda: QSSc(ring_size(max(collections.Counter(wl.queue_ids(wl.w_count)).values()) * wl.msg_count,
+                                      max(map(len, wl.pool)))) if wl else QSSc(),
+        'qsh': QSHc,
+        'qsr1': lambda: QSRc(broker.host, broker.port, consume, durability=durability) if broker
+        else QSRc(consume=consume, durability=durability),  # remote: 'hostname'
+    }
+    ret = [sqcs[name]() for name in S_BACKENDS if backends is None or name in backends]
+    return [PackSc(sqc, pack) for sqc in ret] if pack else ret
+
+
+def a_containers(backends: Optional[Iterable[str]] = None, broker: Optional[Broker] = None,
+                 confirms: Iterable[ConfirmMode] = (ConfirmMode.Each,), consume: bool = False,
+                 topologies: Iterable[Tuple[int, int]] = ((1, 1),), limits: Optional[Tuple[Limit, Limit]] = None,
+                 coalesce: Optional[Tuple[float, int]] = None, pack: int = 0,
+                 durability: Optional[Durability] = None) -> List[QAc]:
+    """Async containers to test.
+    :param backends: A_BACKENDS names (default: all)
+    :param broker: stand-in RabbitMQ (if any)
+    :param confirms: aiormq publisher confirm modes to try
+    :param consume: RabbitMQ get_all() by consumer instead of basic_get polling
+    :param topologies: RabbitMQ (connections, channels per connection) pools to try
+    :param limits: in-memory queue/container ceilings (with spill to disk: put and get phases do not overlap)
+    :param coalesce: coalescing publisher of memory/RabbitMQ containers: max delay, s, and max msgs per flush
+    :param pack: messages per envelope (0: no packing)
+    :param durability: disk/RabbitMQ backends' durability policy (default: theirs)
+    """
+    host = broker.url if broker else 'amqp://localhost'  # remote: 'amqp://hostname'
+    co = dict(zip(('coalesce', 'coalesce_n'), coalesce)) if coalesce else {}
+    aqcs: Dict[str, Callable[[], Iterable[QAc]]] = {
+        'qam': lambda: (QAMc(*limits, spill=QSD3c(), **co) if limits else QAMc(**co),),
+        'qad1': lambda: (QAD1c(durability),),
+        'qah': lambda: (QAHc(),),
+        'qar1': lambda: (QAR1c(host, confirm, consume=consume, conns=conns, chans=chans, durability=durability, **co)
+                         for conns, chans in topologies for confirm in confirms),
+        'qar2': lambda: (QAR2c(host, consume, conns=conns, chans=chans, durability=durability, **co)
+                         for conns, chans in topologies),
+    }
+    ret = [aqc for name in A_BACKENDS if backends is None or name in backends for aqc in aqcs[name]()]
+    return [PackAc(aqc, pack) for aqc in ret] if pack else ret
+
+
+def smain(batch: bool = False, workers: Optional[str] = None, lat: bool = False, broker: Optional[Broker] = None,
+          consume: bool = False, backends: Optional[Iterable[str]] = None, wl: Optional[Workload] = None,
+          isolate: bool = False, ack: bool = False, limits: Optional[Tuple[Limit, Limit]] = None,
+          pack: int = 0, durability: Optional[Durability] = None) -> List[Row]:
+    """Sync.
+    :param broker: stand-in RabbitMQ (if any)
+    :param consume: RabbitMQ get_all() by consumer instead of basic_get polling
+    :param backends: S_BACKENDS names to run (default: all)
+    :param wl: test dimensions (default: from const)
+    :param isolate: each test in a fresh child process
+    :param ack: read by get_ack()/ack()
+    :param limits: in-memory queue/container ceilings (with spill to disk: put and get phases do not overlap)
+    :param pack: messages per envelope (0: no packing)
+    :param durability: disk/RabbitMQ backends' durability policy (default: theirs)
+    """
+    ret = []
+    for sqc in s_containers(backends, broker, consume, limits, pack, durability, wl or Workload()):
+        if workers == 'process' and not sqc.shared:  # in-process only
+            continue
+        if isolate:
+            ret.append(isolated(stest, sqc, batch=batch, workers=workers, lat=lat, wl=wl, ack=ack))
+        else:
+            ret.append(stest(sqc, batch, workers, lat, wl, ack))
+    return ret
+
+
+def amain(batch: bool = False, lat: bool = False, broker: Optional[Broker] = None,
+          confirms: Iterable[ConfirmMode] = (ConfirmMode.Each,), consume: bool = False,
+          topologies: Iterable[Tuple[int, int]] = ((1, 1),), backends: Optional[Iterable[str]] = None,
+          wl: Optional[Workload] = None, isolate: bool = False, ack: bool = False, stream: bool = False,
+          limits: Optional[Tuple[Limit, Limit]] = None, coalesce: Optional[Tuple[float, int]] = None,
+          pack: int = 0, durability: Optional[Durability] = None) -> List[Row]:
+    """Async entry point.
+    :param broker: stand-in RabbitMQ (if any)
+    :param confirms: aiormq publisher confirm modes to try
+    :param consume: RabbitMQ get_all() by consumer instead of basic_get polling
+    :param topologies: RabbitMQ (connections, channels per connection) pools to try
+    :param backends: A_BACKENDS names to run (default: all)
+    :param wl: test dimensions (default: from const)
+    :param isolate: each test in a fresh child process
+    :param ack: read by get_ack()/ack()
+    :param stream: read by `async for`/stream()
+    :param limits: in-memory queue/container ceilings (with spill to disk: put and get phases do not overlap)
+    :param coalesce: coalescing publisher: max delay, s, and max msgs per flush
+    :param pack: messages per envelope (0: no packing)
+    :param durability: disk/RabbitMQ backends' durability policy (default: theirs)
+    """
+    aqc_list = a_containers(backends, broker, confirms, consume, topologies, limits, coalesce, pack, durability)
 
+    async def __inner() -> List[Row]:
+        return [await atest(aqc, batch=batch, lat=lat, wl=wl, ack=ack, stream=stream) for aqc in aqc_list]
 
-def amain():
-    """Async entry point."""
+    if isolate:
+        return [isolated(_arun, aqc, batch=batch, lat=lat, wl=wl, ack=ack, stream=stream) for aqc in aqc_list]
+    return asyncio.run(__inner())
 
-    async def __inner():
-        await atest(QAMc())
-        await atest(QAR1c())  # remote: 'amqp://hostname'
-        await atest(QAR2c())  # remote: as above
 
-    asyncio.run(__inner())
+def topologies(specs: Optional[Iterable[str]]) -> List[Tuple[int, int]]:
+    """Parse --pool values: 'NxM' (connections × channels) or 'all'."""
+    if not specs:
+        return [(1, 1)]
+    if 'all' in specs:
+        return list(TOPOLOGIES)
+    return [tuple(map(int, spec.split('x'))) for spec in specs]
 
 
 if __name__ == '__main__':
+    __parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    __parser.add_argument('--workers', choices=('thread', 'process'), help="run sync writers/readers concurrently")
+    __parser.add_argument('--lat', action='store_true', help="per-call latency histograms")
+    __parser.add_argument('--confirm', action='append', choices=[m.name for m in ConfirmMode],
+                          help="aiormq publisher confirms (repeatable)")
+    __parser.add_argument('--consume', action='store_true', help="RabbitMQ get_all() by consumer, not polling")
+    __parser.add_argument('--pool', action='append', metavar='CONNSxCHANS',
+                          help="async RabbitMQ connections × channels per connection (repeatable; 'all' to sweep)")
+    __parser.add_argument('--ack', action='store_true', help="read by get_ack()/ack(multiple), at-least-once")
+    __parser.add_argument('--stream', action='store_true', help="async read by `async for`/stream()")
+    __parser.add_argument('--limit', type=int, default=0, help="in-memory queue ceiling, msgs (spill to disk)")
+    __parser.add_argument('--ceiling', type=int, default=0, help="in-memory container ceiling, MB (spill to disk)")
+    __parser.add_argument('--coalesce', type=float, default=0.0,
+                          help="async memory/RabbitMQ put() coalescing: max delay, µs (0: off)")
+    __parser.add_argument('--coalesce-n', type=int, default=COALESCE_N, help="put() coalescing: max msgs per flush")
+    __parser.add_argument('--pack', type=int, default=0, help="messages per envelope (0: no packing)")
+    __parser.add_argument('--durability', type=Durability.parse, metavar='none|os|<N>m|<T>ms|each',
+                          help="disk/RabbitMQ durability: no sync, OS buffers, fsync every N msgs/T ms or each write")
+    __parser.add_argument('--sim', action='store_true', help="use in-process RabbitMQ stand-in")
+    __parser.add_argument('--sim-delay', type=float, default=0.0, help="stand-in reply latency, s")
+    __args = __parser.parse_args()
     LOGGER.setLevel(logging.DEBUG)
-    smain()
-    amain()
+    __limits = (Limit(__args.limit), Limit(max_bytes=__args.ceiling << 20)) if __args.limit or __args.ceiling else None
+    __broker = Broker(delay=__args.sim_delay, queues=(f"{i:04d}" for i in range(Q_COUNT))).start() \
+        if __args.sim else None
+    for __batch in (False, True):  # per-message vs batched
+        smain(__batch, __args.workers, __args.lat, __broker, __args.consume, ack=__args.ack, limits=__limits,
+              pack=__args.pack, durability=__args.durability)
+        amain(__batch, __args.lat, __broker, [ConfirmMode[m] for m in __args.confirm or ('Each',)], __args.consume,
+              topologies(__args.pool), ack=__args.ack, stream=__args.stream, limits=__limits,
+              coalesce=(__args.coalesce / 1e6, __args.coalesce_n) if __args.coalesce else None, pack=__args.pack,
+              durability=__args.durability)
+    if __broker:
+        __broker.stop()
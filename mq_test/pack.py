@@ -0,0 +1,336 @@
+"""Message envelopes: many logical messages in one physical one.
+Wraps any container; put_many() packs, get()/get_many()/iteration unpack transparently.
+Envelope: <count:u16><len:u32 × count><data × count>.
+:note: put() of one message is an envelope of one (no gain): packing pays on put_many()
+"""
+# 1. std
+from typing import Iterator, Iterable, List, Optional, Deque, Tuple
+import collections
+import struct
+# 3. local
+from q import QExc, LockScope, Delivery, AckTrack, QStats, QS, QSc, QA, QAc
+# x. const
+PACK_N = 64  # messages per envelope
+PACK_SIZE = 1 << 16  # bytes per envelope (payload)
+DRAIN_ENVS = 100  # get_all(): envelopes per inner get_many()
+_CNT = struct.Struct('<H')
+_LEN_SIZE = 4
+
+
+def pack(items: List[bytes]) -> bytes:
+    n = len(items)
+    return struct.pack(f'<H{n}I', n, *map(len, items)) + b''.join(items)
+
+
+def unpack(env: bytes) -> List[bytes]:
+    n = _CNT.unpack_from(env)[0]
+    off = _CNT.size + _LEN_SIZE * n
+    ret = []
+    for size in struct.unpack_from(f'<{n}I', env, _CNT.size):
+        ret.append(env[off:off + size])
+        off += size
+    if off != len(env):
+        raise QExc(f"Broken envelope: {off} of {len(env)} bytes")
+    return ret
+
+
+def envelopes(data: Iterable[bytes], max_n: int, max_size: int) -> Iterator[bytes]:
+    """Pack data by up to max_n messages or max_size bytes (a bigger message goes alone)."""
+    items, size = [], 0
+    for item in data:
+        if items and (len(items) == max_n or size + len(item) > max_size):
+            yield pack(items)
+            items, size = [], 0
+        items.append(item)
+        size += len(item)
+    if items:
+        yield pack(items)
+
+
+class _Envs:
+    """Delivered envelopes waiting for their messages acked."""
+    __acks: AckTrack
+    __envs: Deque[Tuple[int, Delivery]]  # last message tag, envelope delivery
+
+    def __init__(self):
+        self.__acks = AckTrack()
+        self.__envs = collections.deque()
+
+    def add(self, env: Delivery, items: List[bytes]) -> List[Delivery]:
+        ret = [self.__acks.add(item) for item in items]
+        self.__envs.append((ret[-1].tag, env))
+        return ret
+
+    def ack(self, d: Delivery, multiple: bool) -> List[Delivery]:
+        """:return: envelopes acked in full by now"""
+        ret = []
+        if last := self.__acks.ack(d, multiple):
+            while self.__envs and self.__envs[0][0] <= last.tag:
+                ret.append(self.__envs.popleft()[1])
+        return ret
+
+
+# == Sync ==
+class _PackS(QS):
+    """Packing Sync Queue."""
+    _master: 'PackSc'
+    __q: QS
+    _pending: Deque[bytes]  # unpacked, not got yet
+    _pending_d: Deque[Delivery]  # the same, by get_ack()
+    _in: int  # messages in the backend (put less unpacked, by this queue)
+    __envs: _Envs
+
+    def __init__(self, master: 'PackSc', __id: int):
+        super().__init__(master, __id)
+        self._pending = collections.deque()
+        self._pending_d = collections.deque()
+        self._in = 0
+        self.__envs = _Envs()
+
+    def open(self):
+        self.__q = self._master.inner.q(self._id)
+
+    def count(self) -> int:
+        """:note: an envelope in the backend counts as one"""
+        return self.__q.count() + self._left()
+
+    def _left(self) -> int:
+        """Unpacked messages not got yet."""
+        return len(self._pending) + len(self._pending_d)
+
+    def _unpack(self, env: bytes) -> List[bytes]:
+        ret = unpack(env)
+        self._in -= len(ret)
+        return ret
+
+    def put(self, data: bytes):
+        self.__q.put(pack([data]))
+        self._in += 1
+        self._st.put(1, len(data))
+
+    def put_many(self, data: Iterable[bytes]):
+        data = list(data)
+        self.__q.put_many(envelopes(data, self._master.pack_n, self._master.pack_size))
+        self._in += len(data)
+        self._st.put(len(data), sum(map(len, data)))
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        if not self._pending:
+            if (env := self.__q.get(wait)) is None:
+                return None
+            self._pending.extend(self._unpack(env))
+        return self._st.got1(self._pending.popleft())
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        pending = self._pending
+        while len(pending) < max_n:
+            if not (envs := self.__q.get_many(-(-(max_n - len(pending)) // self._master.pack_n))):
+                break
+            for env in envs:
+                pending.extend(self._unpack(env))
+        return self._st.got([pending.popleft() for _ in range(min(max_n, len(pending)))])
+
+    def get_all(self):
+        """Unpacked by inner get_many() (messages counted, not envelopes)."""
+        while self.get_many(self._master.pack_n * DRAIN_ENVS):
+            ...
+
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Envelope is acked when all of its messages are."""
+        if not self._pending_d:
+            if (env := self.__q.get_ack(wait)) is None:
+                return None
+            self._pending_d.extend(self.__envs.add(env, self._unpack(env.data)))
+        d = self._pending_d.popleft()
+        self._st.got1(d.data)
+        return d
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        if envs := self.__envs.ack(d, multiple):
+            if multiple:
+                self.__q.ack(envs[-1], True)
+            else:
+                for env in envs:
+                    self.__q.ack(env, False)
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> bytes:
+        if (item := self.get(False)) is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        ...
+
+
+class PackSc(QSc):
+    """Packing Sync Queue Container (over any other).
+    :note: in-process only: message depth (see stats()) is kept by its queue objects, the backend sees envelopes
+    """
+    _child_cls = _PackS
+    inner: QSc
+    pack_n: int
+    pack_size: int
+
+    def __init__(self, inner: QSc, pack_n: int = PACK_N, pack_size: int = PACK_SIZE):
+        """:param inner: container to keep envelopes
+        :param pack_n: messages per envelope
+        :param pack_size: bytes per envelope (payload)
+        """
+        super().__init__()
+        if not 0 < pack_n < 1 << 16:
+            raise QExc(f"Messages per envelope: 1..65535, not {pack_n}")
+        self.inner = inner
+        self.pack_n = pack_n
+        self.pack_size = pack_size
+        self.title = f"{inner.title} [pack≤{pack_n}]"
+        self.lock_scope = max(inner.lock_scope, LockScope.Queue)  # unpacked leftovers
+        self.durability = inner.durability
+
+    def open(self, count: int):
+        super().open(count)
+        self.inner.open(count)
+
+    def stats(self) -> List[QStats]:
+        """Counters of messages; depth: messages in the backend (put less unpacked, by this container) + leftovers."""
+        ret = []
+        for i in range(self._count):
+            q = self.q(i)
+            q._st.depth = q._in + q._left()
+            ret.append(q._st)
+        return ret
+
+    def close(self):
+        super().close()
+        self.inner.close()
+
+
+# == Async ==
+class _PackA(QA):
+    """Packing Async Queue."""
+    _master: 'PackAc'
+    __q: QA
+    _pending: Deque[bytes]  # unpacked, not got yet
+    _pending_d: Deque[Delivery]  # the same, by get_ack()
+    _in: int  # messages in the backend (put less unpacked, by this queue)
+    __envs: _Envs
+
+    def __init__(self, master: 'PackAc', __id: int):
+        super().__init__(master, __id)
+        self._pending = collections.deque()
+        self._pending_d = collections.deque()
+        self._in = 0
+        self.__envs = _Envs()
+
+    async def open(self):
+        self.__q = await self._master.inner.q(self._id)
+
+    async def count(self) -> int:
+        """:note: an envelope in the backend counts as one"""
+        return await self.__q.count() + self._left()
+
+    def _left(self) -> int:
+        """Unpacked messages not got yet."""
+        return len(self._pending) + len(self._pending_d)
+
+    def _unpack(self, env: bytes) -> List[bytes]:
+        ret = unpack(env)
+        self._in -= len(ret)
+        return ret
+
+    async def put(self, data: bytes):
+        await self.__q.put(pack([data]))
+        self._in += 1
+        self._st.put(1, len(data))
+
+    async def put_many(self, data: Iterable[bytes]):
+        data = list(data)
+        await self.__q.put_many(envelopes(data, self._master.pack_n, self._master.pack_size))
+        self._in += len(data)
+        self._st.put(len(data), sum(map(len, data)))
+
+    async def get(self, wait: bool = True) -> Optional[bytes]:
+        if not self._pending:
+            if (env := await self.__q.get(wait)) is None:
+                return None
+            self._pending.extend(self._unpack(env))
+        return self._st.got1(self._pending.popleft())
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        pending = self._pending
+        while len(pending) < max_n:
+            if not (envs := await self.__q.get_many(-(-(max_n - len(pending)) // self._master.pack_n))):
+                break
+            for env in envs:
+                pending.extend(self._unpack(env))
+        return self._st.got([pending.popleft() for _ in range(min(max_n, len(pending)))])
+
+    async def get_all(self):
+        """Unpacked by inner get_many() (messages counted, not envelopes)."""
+        while await self.get_many(self._master.pack_n * DRAIN_ENVS):
+            ...
+
+    async def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Envelope is acked when all of its messages are."""
+        if not self._pending_d:
+            if (env := await self.__q.get_ack(wait)) is None:
+                return None
+            self._pending_d.extend(self.__envs.add(env, self._unpack(env.data)))
+        d = self._pending_d.popleft()
+        self._st.got1(d.data)
+        return d
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        if envs := self.__envs.ack(d, multiple):
+            if multiple:
+                await self.__q.ack(envs[-1], True)
+            else:
+                for env in envs:
+                    await self.__q.ack(env, False)
+
+    async def close(self):
+        ...
+
+
+class PackAc(QAc):
+    """Packing Async Queue Container (over any other)."""
+    _child_cls = _PackA
+    inner: QAc
+    pack_n: int
+    pack_size: int
+
+    def __init__(self, inner: QAc, pack_n: int = PACK_N, pack_size: int = PACK_SIZE):
+        """:param inner: container to keep envelopes
+        :param pack_n: messages per envelope
+        :param pack_size: bytes per envelope (payload)
+        """
+        super().__init__()
+        if not 0 < pack_n < 1 << 16:
+            raise QExc(f"Messages per envelope: 1..65535, not {pack_n}")
+        self.inner = inner
+        self.pack_n = pack_n
+        self.pack_size = pack_size
+        self.title = f"{inner.title} [pack≤{pack_n}]"
+        self.durability = inner.durability
+
+    async def open(self, count: int):
+        await super().open(count)
+        await self.inner.open(count)
+
+    async def flush(self):
+        await self.inner.flush()
+
+    async def stats(self) -> List[QStats]:
+        """Counters of messages; depth: messages in the backend (put less unpacked, by this container) + leftovers."""
+        ret = []
+        for i in range(self._count):
+            q = await self.q(i)
+            q._st.depth = q._in + q._left()
+            ret.append(q._st)
+        return ret
+
+    async def close(self):
+        await super().close()
+        await self.inner.close()
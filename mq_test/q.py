@@ -1,7 +1,16 @@
 """Base for MQ engines."""
 import asyncio
-from typing import Dict, Type, Optional
+import collections
+import threading
+import time
+from enum import unique, IntEnum, auto
+from typing import Dict, Type, Optional, Iterable, List, Any, Deque, Set, AsyncIterator, Callable, Awaitable, Tuple
 from abc import ABC, abstractmethod
+# x. const
+STREAM_BATCH = 100  # async iteration prefetch
+COALESCE_N = 256  # coalescing publisher: msgs per flush
+SYNC_N = 100  # durability: fsync every N msgs
+SYNC_T = 0.01  # s, durability: fsync every T
 
 
 class QExc(RuntimeError):
@@ -14,21 +23,360 @@ class QExc(RuntimeError):
         return self.__class__.__name__
 
 
+@unique
+class LockScope(IntEnum):
+    """Locking required to use queues from several threads."""
+    No = auto()  # thread-safe
+    Queue = auto()  # one lock per queue
+    Container = auto()  # one lock per container (shared connection/channel)
+
+
+@unique
+class Sync(IntEnum):
+    """When written messages get to the disk."""
+    No = auto()  # no guarantee (AMQP: transient delivery, SQLite: synchronous=OFF)
+    OS = auto()  # written to the OS, it flushes when it likes
+    Count = auto()  # fsync every N msgs
+    Time = auto()  # fsync every T s (checked on writes)
+    Each = auto()  # fsync each put()/put_many()
+
+
 # == common ==
+class Delivery:
+    """Message got with acknowledgement pending (see .get_ack()/.ack())."""
+    __slots__ = ('data', 'tag', 'pos')
+    data: bytes
+    tag: int  # delivery order (per queue object)
+    pos: Any  # backend-specific: what to commit on ack
+
+    def __init__(self, data: bytes, tag: int, pos: Any = None):
+        self.data = data
+        self.tag = tag
+        self.pos = pos
+
+
+class AckTrack:
+    """Deliveries in flight in order.
+    Log-like backends can commit only a prefix: the commit point moves over the oldest acked ones.
+    """
+    __q: Deque[Delivery]
+    __acked: Set[int]  # single acks beyond the commit point
+    __tag: int
+
+    def __init__(self):
+        self.__q = collections.deque()
+        self.__acked = set()
+        self.__tag = 0
+
+    def __len__(self):
+        return len(self.__q)
+
+    def add(self, data: bytes, pos: Any = None) -> Delivery:
+        self.__tag += 1
+        d = Delivery(data, self.__tag, pos)
+        self.__q.append(d)
+        return d
+
+    def ack(self, d: Delivery, multiple: bool = False) -> Optional[Delivery]:
+        """Ack delivery (and all before it if multiple).
+        :return: last delivery of the new commit point (None if not moved)
+        """
+        q = self.__q
+        ret = None
+        if multiple:
+            while q and q[0].tag <= d.tag:
+                ret = q.popleft()
+                self.__acked.discard(ret.tag)
+        else:
+            self.__acked.add(d.tag)
+        while q and q[0].tag in self.__acked:
+            ret = q.popleft()
+            self.__acked.remove(ret.tag)
+        return ret
+
+
+class Durability:
+    """Durability policy of a container; `track()` gives per queue state."""
+    __slots__ = ('sync', 'n', 't')
+    sync: Sync
+    n: int
+    t: float
+
+    def __init__(self, sync: Sync = Sync.OS, n: int = SYNC_N, t: float = SYNC_T):
+        self.sync = sync
+        self.n = n
+        self.t = t
+
+    @property
+    def persistent(self) -> bool:
+        """Messages are to survive a restart (AMQP delivery mode 2)."""
+        return self.sync > Sync.No
+
+    @staticmethod
+    def parse(spec: str) -> 'Durability':
+        """'none', 'os', 'each', '<N>m' (fsync every N msgs) or '<T>ms' (every T ms)."""
+        if spec in ('none', 'os', 'each'):
+            return Durability({'none': Sync.No, 'os': Sync.OS, 'each': Sync.Each}[spec])
+        if spec.endswith('ms'):
+            return Durability(Sync.Time, t=float(spec[:-2]) / 1000)
+        if spec.endswith('m'):
+            return Durability(Sync.Count, n=int(spec[:-1]))
+        raise QExc(f"Durability: none, os, each, <N>m or <T>ms, not {spec}")
+
+    def track(self) -> 'SyncTrack':
+        return SyncTrack(self)
+
+    def __str__(self):
+        if self.sync == Sync.Count:
+            return f"{self.n}m"
+        if self.sync == Sync.Time:
+            return f"{self.t * 1000:g}ms"
+        return {Sync.No: 'none', Sync.OS: 'os', Sync.Each: 'each'}[self.sync]
+
+
+class SyncTrack:
+    """Writes of a queue since its last fsync."""
+    __slots__ = ('policy', 'n', 't')
+    policy: Durability
+    n: int  # msgs not synced
+    t: float  # last sync, monotonic s
+
+    def __init__(self, policy: Durability):
+        self.policy = policy
+        self.n = 0
+        self.t = time.monotonic()
+
+    def wrote(self, n: int) -> bool:
+        """Count n msgs written.
+        :return: fsync is due (then it is taken as done)
+        """
+        self.n += n
+        sync = self.policy.sync
+        if sync <= Sync.OS or not self.n:
+            return False
+        if sync == Sync.Count and self.n < self.policy.n:
+            return False
+        if sync == Sync.Time:
+            if (now := time.monotonic()) - self.t < self.policy.t:
+                return False
+            self.t = now
+        self.n = 0
+        return True
+
+    def pending(self) -> bool:
+        """Something written is not synced by the policy yet (to sync on close)."""
+        return self.policy.sync > Sync.OS and self.n > 0
+
+
+class Limit:
+    """Messages/bytes ceiling (0: unlimited) and usage against it."""
+    __slots__ = ('max_n', 'max_bytes', 'n', 'size')
+    max_n: int
+    max_bytes: int
+    n: int
+    size: int
+
+    def __init__(self, max_n: int = 0, max_bytes: int = 0):
+        self.max_n = max_n
+        self.max_bytes = max_bytes
+        self.n = self.size = 0
+
+    def __bool__(self):
+        return bool(self.max_n or self.max_bytes)
+
+    def __str__(self):
+        size = f"{self.max_bytes >> 20}MiB" if self.max_bytes and not self.max_bytes & 0xFFFFF else f"{self.max_bytes}B"
+        return '+'.join(filter(None, (f"{self.max_n}m" if self.max_n else None, size if self.max_bytes else None)))
+
+    def copy(self) -> 'Limit':
+        """Same ceiling, no usage."""
+        return Limit(self.max_n, self.max_bytes)
+
+    def fits(self, size: int) -> bool:
+        """Room for a message; empty takes any (else a too big one never fits)."""
+        return not self.n or ((not self.max_n or self.n < self.max_n)
+                              and (not self.max_bytes or self.size + size <= self.max_bytes))
+
+    def add(self, n: int, size: int):
+        self.n += n
+        self.size += size
+
+
+class SGate:
+    """Sync backpressure: queue and container limits, producers wait on `cond`.
+    :note: call with `cond` held
+    """
+    cond: threading.Condition
+    __c: Limit
+
+    def __init__(self, c_limit: Limit):
+        self.cond = threading.Condition()
+        self.__c = c_limit.copy()
+
+    def fits(self, q_limit: Limit, size: int) -> bool:
+        return q_limit.fits(size) and self.__c.fits(size)
+
+    def wait(self, q_limit: Limit, size: int):
+        self.cond.wait_for(lambda: self.fits(q_limit, size))
+
+    def add(self, q_limit: Limit, n: int, size: int):
+        """Take (n > 0) or free (n < 0) room; freeing wakes producers."""
+        q_limit.add(n, size)
+        self.__c.add(n, size)
+        if n < 0:
+            self.cond.notify_all()
+
+
+class AGate:
+    """Async backpressure: queue and container limits, producers await `cond`.
+    :note: call with `cond` held
+    """
+    cond: asyncio.Condition
+    __c: Limit
+
+    def __init__(self, c_limit: Limit):
+        self.cond = asyncio.Condition()
+        self.__c = c_limit.copy()
+
+    def fits(self, q_limit: Limit, size: int) -> bool:
+        return q_limit.fits(size) and self.__c.fits(size)
+
+    async def wait(self, q_limit: Limit, size: int):
+        await self.cond.wait_for(lambda: self.fits(q_limit, size))
+
+    def add(self, q_limit: Limit, n: int, size: int):
+        """Take (n > 0) or free (n < 0) room; freeing wakes producers."""
+        q_limit.add(n, size)
+        self.__c.add(n, size)
+        if n < 0:
+            self.cond.notify_all()
+
+
+class Coalescer:
+    """Async write coalescing: put() waits while (queue, data) pairs gather for up to `delay` s or `max_n` msgs,
+    then all of them go to `sink` at once; its outcome resolves every put() of the burst.
+    """
+    __sink: Callable[[List[Tuple[Any, bytes]]], Awaitable]
+    __delay: float
+    __max_n: int
+    __buf: List[Tuple[Any, bytes]]
+    __futs: List[asyncio.Future]
+    __timer: Optional[asyncio.TimerHandle]
+    __flushing: Set[asyncio.Task]
+
+    def __init__(self, sink: Callable[[List[Tuple[Any, bytes]]], Awaitable], delay: float, max_n: int = COALESCE_N):
+        """:param sink: coroutine function to write a burst (in put() order)"""
+        self.__sink = sink
+        self.__delay = delay
+        self.__max_n = max_n
+        self.__buf = []
+        self.__futs = []
+        self.__timer = None
+        self.__flushing = set()
+
+    async def put(self, q: Any, data: bytes):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.__buf.append((q, data))
+        self.__futs.append(fut)
+        if len(self.__buf) >= self.__max_n:
+            self.__kick()
+        elif not self.__timer:
+            self.__timer = loop.call_later(self.__delay, self.__kick)
+        await fut
+
+    def __kick(self):
+        """Hand the burst over to the sink."""
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+        if not self.__buf:
+            return
+        task = asyncio.create_task(self.__flush(self.__buf, self.__futs))
+        self.__buf, self.__futs = [], []
+        self.__flushing.add(task)
+        task.add_done_callback(self.__flushing.discard)
+
+    async def __flush(self, burst: List[Tuple[Any, bytes]], futs: List[asyncio.Future]):
+        try:
+            await self.__sink(burst)
+        except Exception as e:
+            for fut in futs:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for fut in futs:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def drain(self):
+        """Flush the rest now, wait for all the bursts."""
+        self.__kick()
+        if self.__flushing:
+            await asyncio.wait(list(self.__flushing))
+
+
+class QStats:
+    """Queue counters: messages now; messages and bytes put/got since open (by this queue object)."""
+    __slots__ = ('depth', 'n_put', 'n_get', 'b_put', 'b_get')
+    depth: int
+    n_put: int
+    n_get: int
+    b_put: int
+    b_get: int
+
+    def __init__(self):
+        self.depth = self.n_put = self.n_get = self.b_put = self.b_get = 0
+
+    def put(self, n: int, size: int):
+        self.n_put += n
+        self.b_put += size
+
+    def got(self, items: List[bytes]) -> List[bytes]:
+        """Count items got, pass them through."""
+        self.n_get += len(items)
+        self.b_get += sum(map(len, items))
+        return items
+
+    def got1(self, data: Optional[bytes]) -> Optional[bytes]:
+        if data is not None:
+            self.n_get += 1
+            self.b_get += len(data)
+        return data
+
+    @staticmethod
+    def total(stats: Iterable['QStats']) -> 'QStats':
+        ret = QStats()
+        for st in stats:
+            for k in QStats.__slots__:
+                setattr(ret, k, getattr(ret, k) + getattr(st, k))
+        return ret
+
+    def __str__(self):
+        return f"depth={self.depth}, put={self.n_put}/{self.b_put}B, got={self.n_get}/{self.b_get}B"
+
+
+def q_name(i: int) -> str:
+    """Backend name of queue #i."""
+    return f"{i:04d}"
+
+
 class Q:
     """Queue base class.
     One object per queue.
     """
     _master: 'Qc'
     _id: int
+    _st: QStats
 
     def __init__(self, master: 'Qc', _id: int):
         self._master = master
         self._id = _id
+        self._st = QStats()
 
     @property
     def _q_name(self):
-        return f"{self._id:04d}"
+        return q_name(self._id)
 
 
 class Qc:
@@ -36,6 +384,7 @@ class Qc:
      Provides Qs uniqueness.
      """
     title: str = "Queue (base)"
+    durability: Optional[Durability] = None  # policy honored (None: not applicable)
     _child_cls: Type[Q]
     _store: Dict[int, Q]
     _count: int
@@ -44,6 +393,12 @@ class Qc:
         self._store = {}
         self._count = 0
 
+    def __getstate__(self):
+        """Pickle settings only (to open a copy in a child process)."""
+        state = self.__dict__.copy()
+        state['_store'] = {}
+        return state
+
 
 # == Sync ==
 class QS(Q, ABC):
@@ -74,10 +429,31 @@ class QS(Q, ABC):
         """Clean query."""
         raise NotImplementedError()
 
+    @abstractmethod
+    def put_many(self, data: Iterable[bytes]):
+        """Put messages in bulk."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_many(self, max_n: int) -> List[bytes]:
+        """Get up to max_n messages w/o waiting."""
+        raise NotImplementedError()
+
     @abstractmethod
     def close(self):
         raise NotImplementedError()
 
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Get a message to ack later (at-least-once).
+        Default: auto-acked get(), ack() is no-op.
+        """
+        if (data := self.get(wait)) is not None:
+            return Delivery(data, 0)
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        """Commit consumption of delivery (and all of this queue got before it if multiple)."""
+        ...
+
     def __init__(self, master: 'QSc', _id: int):
         super().__init__(master, _id)
 
@@ -85,11 +461,20 @@ class QS(Q, ABC):
 class QSc(Qc):
     """Queue Sync Container."""
     title: str = "Queue Sync (base)"
+    lock_scope: LockScope = LockScope.Container
+    shared: bool = False  # queues are reachable from other processes
     _child_cls: Type[QS]
     _store: Dict[int, QS]
+    _opening: Dict[int, threading.Lock]  # per queue: one thread opens, the others wait
 
     def __init__(self):
         super().__init__()
+        self._opening = {}
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_opening'] = {}
+        return state
 
     def open(self, count: int):
         self._count = count
@@ -99,13 +484,27 @@ class QSc(Qc):
             child.close()
         self._store.clear()
 
+    def stats(self) -> List[QStats]:
+        """Counters of all the queues; depth by count() of each (backends override to get it at once)."""
+        ret = []
+        for i in range(self._count):
+            q = self.q(i)
+            q._st.depth = q.count()
+            ret.append(q._st)
+        return ret
+
     def q(self, i: int) -> QS:
+        """Get queue, opened once (concurrent callers wait for it)."""
+        if (ret := self._store.get(i)) is not None:
+            return ret
         if i >= self._count:
             raise QExc(f"Too big num {i}")
-        if i not in self._store:
-            self._store[i] = self._child_cls(self, i)
-            self._store[i].open()
-        return self._store[i]
+        with self._opening.setdefault(i, threading.Lock()):  # setdefault() is atomic
+            if (ret := self._store.get(i)) is None:
+                ret = self._child_cls(self, i)
+                ret.open()
+                self._store[i] = ret  # published opened only
+        return ret
 
 
 # == Async ==
@@ -138,10 +537,45 @@ class QA(Q, ABC):
         """Get all message."""
         raise NotImplementedError()
 
+    @abstractmethod
+    async def put_many(self, data: Iterable[bytes]):
+        """Put messages in bulk."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def get_many(self, max_n: int) -> List[bytes]:
+        """Get up to max_n messages w/o waiting."""
+        raise NotImplementedError()
+
     @abstractmethod
     async def close(self):
         raise NotImplementedError()
 
+    async def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Get a message to ack later (at-least-once).
+        Default: auto-acked get(), ack() is no-op.
+        """
+        if (data := await self.get(wait)) is not None:
+            return Delivery(data, 0)
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        """Commit consumption of delivery (and all of this queue got before it if multiple)."""
+        ...
+
+    async def stream(self, batch: int = STREAM_BATCH) -> AsyncIterator[List[bytes]]:
+        """Get messages in chunks of up to `batch` until the queue is empty."""
+        while chunk := await self.get_many(batch):
+            yield chunk
+
+    async def __messages(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream():
+            for item in chunk:
+                yield item
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        """`async for msg in q`: one by one from a stream() chunk, until the queue is empty."""
+        return self.__messages()
+
     def __init__(self, master: 'QAc', _id: int):
         super().__init__(master, _id)
 
@@ -151,21 +585,50 @@ class QAc(Qc):
     title: str = "Queue Async (base)"
     _child_cls: Type[QA]
     _store: Dict[int, QA]
+    _opening: Dict[int, 'asyncio.Task[QA]']  # per queue: the first caller opens, the others await it
 
     def __init__(self):
         super().__init__()
+        self._opening = {}
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_opening'] = {}
+        return state
 
     async def open(self, count: int):
         self._count = count
 
+    async def flush(self):
+        """Wait for puts in flight (if any)."""
+        ...
+
     async def close(self):
         await asyncio.gather(*[child.close() for child in self._store.values()])
         self._store.clear()
 
+    async def stats(self) -> List[QStats]:
+        """Counters of all the queues; depth by count() of each, concurrently (backends override to get it at once)."""
+        qs = await asyncio.gather(*[self.q(i) for i in range(self._count)])
+        for q, depth in zip(qs, await asyncio.gather(*[q.count() for q in qs])):
+            q._st.depth = depth
+        return [q._st for q in qs]
+
     async def q(self, i: int) -> QA:
+        """Get queue, opened once (concurrent callers await the same open)."""
+        if (ret := self._store.get(i)) is not None:
+            return ret
         if i >= self._count:
             raise QExc(f"Too big num {i}")
-        if i not in self._store:
-            self._store[i] = self._child_cls(self, i)
-            await self._store[i].open()
-        return self._store[i]
+        if (task := self._opening.get(i)) is None:
+            task = self._opening[i] = asyncio.create_task(self.__open(i))
+        return await task
+
+    async def __open(self, i: int) -> QA:
+        try:
+            ret = self._child_cls(self, i)
+            await ret.open()
+            self._store[i] = ret  # published opened only
+            return ret
+        finally:
+            del self._opening[i]
@@ -0,0 +1,259 @@
+"""Queue Async Disk-based #1.
+Append-only log per queue written by a dedicated thread with group commit:
+all the puts pending at once become one write + fdatasync() per queue, then their awaits return.
+Record: <len:u32><data>; consumed position is kept in a separate offset file.
+:note: durability Each (default) is an fdatasync() per group commit; Count/Time skip it until due, No/OS never sync
+"""
+# 1. std
+from typing import Optional, Iterable, List, Deque, Dict, Tuple
+import asyncio
+import collections
+import os
+import queue
+import struct
+import threading
+# 3. local
+from q import Sync, Durability, SyncTrack, Delivery, AckTrack, QA, QAc
+# x. const
+_LEN = struct.Struct('<I')
+_OFS = struct.Struct('<Q')
+_sync = getattr(os, 'fdatasync', os.fsync)
+
+
+class _QAD1(QA):
+    """Disk-based #1 Async Queue."""
+    _master: 'QAD1c'
+    __path: str
+    __log: int  # fd
+    __ofs: int  # fd
+    __size: int  # log bytes (writer thread)
+    __head: int  # consumed (committed) bytes (event loop)
+    __sent: int  # delivered bytes (event loop), > head if acks pending
+    __acks: AckTrack
+    __sync: SyncTrack  # log
+    __q: Deque[bytes]  # durable, not consumed yet
+    __ready: asyncio.Event
+    ofs_queued: bool  # head commit is pending
+
+    def __init__(self, master: 'QAD1c', __id: int):
+        super().__init__(master, __id)
+        self.__path = f"_d1ad/{__id:04d}"
+        self.__q = collections.deque()
+        self.__ready = asyncio.Event()
+        self.ofs_queued = False
+        self.__acks = AckTrack()
+        self.__sync = master.durability.track()
+
+    def __load(self):
+        """Open files, read unconsumed backlog."""
+        os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+        self.__log = os.open(f"{self.__path}.log", os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self.__ofs = os.open(f"{self.__path}.ofs", os.O_RDWR | os.O_CREAT, 0o644)
+        raw = os.pread(self.__ofs, _OFS.size, 0)
+        self.__size = os.fstat(self.__log).st_size
+        head = _OFS.unpack(raw)[0] if len(raw) == _OFS.size else 0
+        self.__head = self.__sent = min(head, self.__size)  # log compacted w/o its offset saved: all consumed
+        data = os.pread(self.__log, self.__size - self.__head, self.__head)
+        off = 0
+        while off + _LEN.size <= len(data):
+            n = _LEN.unpack_from(data, off)[0]
+            if off + _LEN.size + n > len(data):  # torn tail
+                break
+            self.__q.append(data[off + _LEN.size:off + _LEN.size + n])
+            off += _LEN.size + n
+        self.__size = self.__head + off
+        os.ftruncate(self.__log, self.__size)
+
+    async def open(self):
+        await asyncio.to_thread(self.__load)
+        if self.__q:
+            self.__ready.set()
+
+    # == writer thread side ==
+    def append(self, data: bytes, n: int):
+        """Write n records, sync if due."""
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.__log, view):]
+        if self.__sync.wrote(n):
+            _sync(self.__log)
+        self.__size += len(data)
+
+    def commit_head(self):
+        """Persist consumed position."""
+        self.ofs_queued = False
+        os.pwrite(self.__ofs, _OFS.pack(self.__head), 0)
+        if self._master.durability.sync > Sync.OS:
+            _sync(self.__ofs)
+
+    def finish(self):
+        """Compact if consumed, close files.
+        :note: offset goes first: a crash before the log is truncated redelivers it, not leaves offset beyond log end
+        """
+        if self.__head == self.__size:
+            self.__head = 0
+            self.commit_head()
+            os.ftruncate(self.__log, 0)
+        else:
+            if self.__sync.pending():
+                _sync(self.__log)
+            self.commit_head()
+        os.close(self.__log)
+        os.close(self.__ofs)
+
+    # == event loop side ==
+    def committed(self, data: List[bytes]):
+        """Make durable messages available."""
+        self.__q.extend(data)
+        self.__ready.set()
+
+    def __sent_out(self, size: int):
+        """Delivered size bytes of records."""
+        self.__sent += size
+        if not self.__q:
+            self.__ready.clear()
+
+    def __commit(self, head: int):
+        """Move head, queue its commit."""
+        self.__head = head
+        if not self.ofs_queued:
+            self.ofs_queued = True
+            self._master.submit(self, None, None)
+
+    def __consumed(self, size: int):
+        """Deliver and commit size bytes of records."""
+        self.__sent_out(size)
+        self.__commit(self.__sent)
+
+    async def count(self) -> int:
+        return len(self.__q)
+
+    async def put(self, data: bytes):
+        await self.put_many((data,))
+
+    async def put_many(self, data: Iterable[bytes]):
+        fut = asyncio.get_running_loop().create_future()
+        data = list(data)
+        self._master.submit(self, data, fut)
+        await fut
+        self._st.put(len(data), sum(map(len, data)))
+
+    async def get(self, wait: bool = True) -> Optional[bytes]:
+        while not self.__q:
+            if not wait:
+                return None
+            await self.__ready.wait()
+        data = self.__q.popleft()
+        self.__consumed(_LEN.size + len(data))
+        return self._st.got1(data)
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while self.__q and len(ret) < max_n:
+            ret.append(self.__q.popleft())
+        if ret:
+            self.__consumed(sum(map(len, ret)) + _LEN.size * len(ret))
+        return self._st.got(ret)
+
+    async def get_all(self):
+        while await self.get_many(len(self.__q) or 1):
+            ...
+
+    async def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Head is committed on ack only."""
+        while not self.__q:
+            if not wait:
+                return None
+            await self.__ready.wait()
+        data = self.__q.popleft()
+        self.__sent_out(_LEN.size + len(data))
+        return self.__acks.add(self._st.got1(data), self.__sent)
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        if last := self.__acks.ack(d, multiple):
+            self.__commit(last.pos)
+
+    async def close(self):
+        ...
+
+
+_Job = Optional[Tuple[_QAD1, Optional[List[bytes]], Optional[asyncio.Future]]]  # None == stop
+
+
+class QAD1c(QAc):
+    """Disk-based #1 Async Queue Container."""
+    title: str = "Queue Async (Disk (group commit))"
+    _child_cls = _QAD1
+    commits: int  # group commits done
+    __loop: asyncio.AbstractEventLoop
+    __jobs: 'queue.SimpleQueue[_Job]'
+    __thread: threading.Thread
+
+    def __init__(self, durability: Optional[Durability] = None):
+        super().__init__()
+        self.commits = 0
+        self.durability = durability or Durability(Sync.Each)
+
+    async def open(self, count: int):
+        await super().open(count)
+        self.__loop = asyncio.get_running_loop()
+        self.__jobs = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__writer, name='qad1', daemon=True)
+        self.__thread.start()
+
+    def submit(self, q: _QAD1, data: Optional[List[bytes]], fut: Optional[asyncio.Future]):
+        """Queue put (data + future) or head commit (None, None)."""
+        self.__jobs.put((q, data, fut))
+
+    def __writer(self):
+        """Group commit loop."""
+        stop = False
+        while not stop:
+            jobs = [self.__jobs.get()]
+            while True:
+                try:
+                    jobs.append(self.__jobs.get_nowait())
+                except queue.Empty:
+                    break
+            chunks: Dict[_QAD1, List[bytes]] = {}
+            heads = set()
+            puts = []
+            for job in jobs:
+                if job is None:
+                    stop = True
+                    continue
+                q, data, fut = job
+                if data is None:
+                    heads.add(q)
+                    continue
+                chunks.setdefault(q, []).extend(_LEN.pack(len(item)) + item for item in data)
+                puts.append(job)
+            err = None
+            try:
+                for q, records in chunks.items():
+                    q.append(b''.join(records), len(records))
+                for q in heads:
+                    q.commit_head()
+            except OSError as e:
+                err = e
+            if chunks:
+                self.commits += 1
+            if puts:
+                self.__loop.call_soon_threadsafe(self.__committed, puts, err)
+
+    @staticmethod
+    def __committed(puts: List[_Job], err: Optional[OSError]):
+        for q, data, fut in puts:
+            if err is None:
+                q.committed(data)
+            if not fut.done():
+                if err is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(err)
+
+    async def close(self):
+        self.__jobs.put(None)
+        await asyncio.to_thread(self.__thread.join)
+        await asyncio.gather(*[asyncio.to_thread(child.finish) for child in self._store.values()])
+        await super().close()
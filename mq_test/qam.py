@@ -2,46 +2,130 @@
 Powered by [stdlib](https://docs.python.org/3/library/asyncio-queue.html)
 """
 # 1. std
-from typing import Optional
+from typing import Optional, Iterable, List, Dict, Tuple
 import asyncio
 # 3. local
-from q import QAc, QA
+from q import COALESCE_N, Limit, AGate, Coalescer, QSc, QS, QAc, QA
 # x. const
 GET_TIMEOUT = 1  # sec
+WAIT_TICK = 0.1  # s, bounded waiting get(): spill re-check period
 
 
 # == Async ==
 class _QAM(QA):
     """Memory Async Queue."""
+    _master: 'QAMc'
     __q: asyncio.Queue
+    __limit: Limit
+    __spill: Optional[QS]
+    __spilled: int  # messages in spill (all newer than in memory)
 
     def __init__(self, master: 'QAMc', __id: int):
         super().__init__(master, __id)
         self.__q = asyncio.Queue()
+        self.__limit = master.q_limit.copy()
+        self.__spill = None
+        self.__spilled = 0
 
     async def open(self):
-        ...
+        if self._master.spill:
+            self.__spill = self._master.spill.q(self._id)
+            self.__spilled = self.__spill.count()
 
     async def count(self) -> int:
-        return self.__q.qsize()
+        return self.__q.qsize() + self.__spilled
 
     async def put(self, data: bytes):
-        await self.__q.put(data)
+        if self._master.coalescer:
+            await self._master.coalescer.put(self, data)  # counted by put_many()
+        elif self._master.gate:
+            await self.put_many((data,))
+        else:
+            await self.__q.put(data)
+            self._st.put(1, len(data))
 
     async def get(self, wait: bool = True) -> Optional[bytes]:
+        if self._master.gate:
+            return await self.__get_bounded(wait)
         if wait:
-            return await self.__q.get()
+            return self._st.got1(await self.__q.get())
         else:
             try:
-                return self.__q.get_nowait()
+                return self._st.got1(self.__q.get_nowait())
             except asyncio.QueueEmpty:
                 return None
 
+    async def __get_bounded(self, wait: bool) -> Optional[bytes]:
+        while not (ret := await self.get_many(1)):
+            if not wait:
+                return None
+            try:
+                data = await asyncio.wait_for(self.__q.get(), WAIT_TICK)  # or spilled meanwhile (container limit)
+            except asyncio.TimeoutError:
+                continue
+            await self.__freed([data])
+            return self._st.got1(data)
+        return ret[0]
+
     async def get_all(self):
         ret = True
         while ret:
             ret = await self.get(False)
 
+    async def put_many(self, data: Iterable[bytes]):
+        """Bounded: wait for room or spill (all the rest, to keep FIFO)."""
+        if not (gate := self._master.gate):
+            n = size = 0
+            for item in data:
+                self.__q.put_nowait(item)  # unbounded
+                n += 1
+                size += len(item)
+            self._st.put(n, size)
+            return
+        limit = self.__limit
+        over = []
+        n = b = 0  # put to memory
+        async with gate.cond:
+            for item in data:
+                size = len(item)
+                if not over and not self.__spilled:
+                    if not self.__spill:
+                        await gate.wait(limit, size)
+                    if gate.fits(limit, size):
+                        gate.add(limit, 1, size)
+                        self.__q.put_nowait(item)
+                        n += 1
+                        b += size
+                        continue
+                over.append(item)
+            if over:
+                self.__spill.put_many(over)
+                self.__spilled += len(over)
+            self._st.put(n + len(over), b + sum(map(len, over)))
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        """Bounded: memory first, then spill."""
+        ret = []
+        try:
+            while len(ret) < max_n:
+                ret.append(self.__q.get_nowait())
+        except asyncio.QueueEmpty:
+            ...
+        if self._master.gate:
+            await self.__freed(ret, max_n)
+        return self._st.got(ret)
+
+    async def __freed(self, got: List[bytes], max_n: int = 0):
+        """Release room of got from memory, add from spill up to max_n."""
+        gate = self._master.gate
+        async with gate.cond:
+            if got:
+                gate.add(self.__limit, -len(got), -sum(map(len, got)))
+            if self.__spilled and len(got) < max_n:
+                more = self.__spill.get_many(max_n - len(got))
+                self.__spilled -= len(more)
+                got.extend(more)
+
     async def close(self):
         ...
 
@@ -50,3 +134,68 @@ class QAMc(QAc):
     """Memory Async Queue Container."""
     title: str = "Queue Async (memory)"
     _child_cls = _QAM
+    q_limit: Limit
+    c_limit: Limit
+    spill: Optional[QSc]
+    gate: Optional[AGate]
+    coalesce: float
+    coalesce_n: int
+    coalescer: Optional[Coalescer]
+
+    def __init__(self, q_limit: Optional[Limit] = None, c_limit: Optional[Limit] = None,
+                 spill: Optional[QSc] = None, coalesce: float = 0.0, coalesce_n: int = COALESCE_N):
+        """:param q_limit: per queue ceiling (put() waits for room)
+        :param c_limit: all the queues ceiling
+        :param spill: overflow container (put() spills instead of waiting; FIFO: newer follow while any spilled)
+        :param coalesce: s, put() waits for others up to that (0: off) or coalesce_n msgs; one put_many() per queue
+        :note: spill is sync (called in the loop): a local disk one that does not keep its backlog in memory
+        """
+        super().__init__()
+        self.q_limit = q_limit or Limit()
+        self.c_limit = c_limit or Limit()
+        self.spill = spill
+        self.gate = None
+        self.coalesce = coalesce
+        self.coalesce_n = coalesce_n
+        self.coalescer = None
+        if self.q_limit or self.c_limit:
+            notes = ', '.join(filter(None, (f"q≤{self.q_limit}" if self.q_limit else None,
+                                            f"c≤{self.c_limit}" if self.c_limit else None,
+                                            'spill' if spill else None)))
+            self.title = f"{self.title} [{notes}]"
+        if coalesce:
+            self.title = f"{self.title} [coalesce={coalesce * 1e6:g}µs/{coalesce_n}]"
+
+    async def open(self, count: int):
+        await super().open(count)
+        if self.q_limit or self.c_limit:
+            self.gate = AGate(self.c_limit)
+            if self.spill:
+                self.spill.open(count)
+        if self.coalesce:
+            self.coalescer = Coalescer(self.__write, self.coalesce, self.coalesce_n)
+
+    @staticmethod
+    async def __write(burst: List[Tuple[_QAM, bytes]]):
+        """Coalesced puts: one put_many() per queue."""
+        by_q: Dict[_QAM, List[bytes]] = {}
+        for q, data in burst:
+            by_q.setdefault(q, []).append(data)
+        await asyncio.gather(*[q.put_many(items) for q, items in by_q.items()])
+
+    async def flush(self):
+        if self.coalescer:
+            await self.coalescer.drain()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['gate'] = state['coalescer'] = None
+        return state
+
+    async def close(self):
+        await self.flush()
+        self.coalescer = None
+        await super().close()
+        if self.gate and self.spill:
+            self.spill.close()
+        self.gate = None
@@ -1,44 +1,142 @@
 """Queue Async RabbitMQ #1.
 Powered by [aiormq](https://github.com/mosquito/aiormq)
 """
-from typing import Optional
+import asyncio
+import collections
+import zlib
+from enum import unique, IntEnum, auto
+from typing import Optional, Iterable, List, Deque, Dict, Tuple
 # 2. 3rd
 import aiormq
 import aiormq.abc
 # 3. local
-from q import QA, QAc
+from q import COALESCE_N, q_name, QExc, Durability, Delivery, Coalescer, QStats, QA, QAc
+# x. const
+WINDOW = 256  # unconfirmed publishes in flight
+PREFETCH = 100  # consume mode
+IDLE_TIMEOUT = 1  # s, consume mode: stop if nothing comes
+STATS_CHANS = 16  # stats(): passive declares in flight (one RPC at a time per channel)
+
+
+@unique
+class ConfirmMode(IntEnum):
+    """Publisher confirms strategy."""
+    No = auto()  # no confirms (fire and forget)
+    Each = auto()  # wait for each confirm
+    Window = auto()  # up to `window` unconfirmed, put() waits for a free slot
+    Batch = auto()  # unlimited unconfirmed, wait for all on flush()
 
 
 class _QAR1(QA):
     """Queue Async RabbitMQ (aiormq)."""
     _master: 'QAR1c'  # to avoid editor inspection warning
+    __chan: aiormq.abc.AbstractChannel
+    __unacked: Optional[Deque[int]]  # delivery tags got by get_ack() if the channel is shared
 
     def __init__(self, master: 'QAR1c', __id: int):
         super().__init__(master, __id)
 
     async def open(self):
-        ...
+        self.__chan = self._master.chan_of(self._q_name)
+        self.__unacked = collections.deque() if self._master.chan_shared(self._q_name) else None
 
     async def count(self) -> int:
-        ret = await self._master.chan.queue_declare(queue=self._q_name, passive=True)
+        ret = await self.__chan.queue_declare(queue=self._q_name, passive=True)
         return ret.message_count
 
     async def put(self, data: bytes):
-        await self._master.chan.basic_publish(
-            body=data,
-            routing_key=self._q_name,
-            properties=aiormq.spec.Basic.Properties(delivery_mode=2)  # 2=persistent
-        )
+        if self._master.coalescer:
+            await self._master.coalescer.put((self.__chan, self._q_name), data)
+        else:
+            await self._master.publish(self.__chan, self._q_name, data)
+        self._st.put(1, len(data))
 
     async def get(self, _: bool = True) -> Optional[bytes]:
         """:note: wait not used."""
-        if rsp := await self._master.chan.basic_get(self._q_name, no_ack=True):
-            return rsp.body
+        rsp = await self.__chan.basic_get(self._q_name, no_ack=True)
+        if isinstance(rsp.delivery, aiormq.spec.Basic.GetOk):  # not GetEmpty
+            return self._st.got1(rsp.body)
+
+    async def get_ack(self, _: bool = True) -> Optional[Delivery]:
+        """:note: wait not used."""
+        rsp = await self.__chan.basic_get(self._q_name, no_ack=False)
+        if isinstance(rsp.delivery, aiormq.spec.Basic.GetOk):
+            if self.__unacked is not None:
+                self.__unacked.append(rsp.delivery.delivery_tag)
+            return Delivery(self._st.got1(rsp.body), rsp.delivery.delivery_tag)
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        """:note: delivery tags are per channel: on a channel shared with other queues `multiple` acks
+        this queue's deliveries one by one (a multiple ack would take the others' too)
+        """
+        if (tags := self.__unacked) is None:
+            await self.__chan.basic_ack(d.tag, multiple=multiple)
+        elif multiple:
+            while tags and tags[0] <= d.tag:
+                await self.__chan.basic_ack(tags.popleft())
+        else:
+            tags.remove(d.tag)
+            await self.__chan.basic_ack(d.tag)
 
     async def get_all(self):
+        if self._master.consume:
+            await self.__get_all_consume()
+            return
         while await self.get():
             ...
 
+    async def __get_all_consume(self):
+        """Push-based: consume up to queue depth snapshot, ack by `multiple`.
+        Own channel, so `multiple` acks do not touch other consumers.
+        """
+        if not (count := await self.count()):
+            return
+        chan = await self._master.consumer_channel(self._q_name)
+        ack_every = max(1, self._master.prefetch // 2)
+        got = 0
+        last: Optional[int] = None  # delivery tag not acked yet
+        done = asyncio.get_running_loop().create_future()
+
+        async def on_msg(msg: aiormq.abc.DeliveredMessage):
+            nonlocal got, last
+            tag = msg.delivery.delivery_tag
+            if got >= count:  # beyond the snapshot
+                await chan.basic_nack(tag, requeue=True)
+                return
+            got += 1
+            self._st.got1(msg.body)
+            last = tag
+            if got == count or not got % ack_every:
+                last = None
+                await chan.basic_ack(tag, multiple=True)
+            if got == count and not done.done():
+                done.set_result(None)
+
+        ok = await chan.basic_consume(self._q_name, on_msg, no_ack=False)
+        try:
+            while not done.done():
+                n = got
+                await asyncio.wait({done}, timeout=IDLE_TIMEOUT)
+                if got == n:  # stalled
+                    break
+            if last is not None:  # got (and counted) since the last ack
+                await chan.basic_ack(last, multiple=True)
+            await chan.basic_cancel(ok.consumer_tag)
+        finally:
+            await chan.close()
+
+    async def put_many(self, data: Iterable[bytes]):
+        """Pipelined: all publishes in flight, then wait for confirms (if waited)."""
+        data = list(data)
+        await asyncio.gather(*[self._master.publish(self.__chan, self._q_name, item) for item in data])
+        self._st.put(len(data), sum(map(len, data)))
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while len(ret) < max_n and (item := await self.get()) is not None:
+            ret.append(item)
+        return ret
+
     async def close(self):
         ...
 
@@ -48,20 +146,144 @@ class QAR1c(QAc):
     title: str = "Queue Async (RabbitMQ (aiormq))"
     _child_cls = _QAR1
     __host: str
-    __conn: aiormq.abc.AbstractConnection
-    chan: aiormq.abc.AbstractChannel
+    __conns: List[aiormq.abc.AbstractConnection]
+    __chans: List[aiormq.abc.AbstractChannel]  # conns × chans, conn-major
+    __chan_load: Dict[int, int]  # queues per channel
+    __stats_chans: List[aiormq.abc.AbstractChannel]  # stats() only, on demand
+    conns: int
+    chans: int  # per connection
+    confirm: ConfirmMode
+    consume: bool
+    prefetch: int
+    __properties: aiormq.spec.Basic.Properties
+    __window: Optional[asyncio.Semaphore]
+    __inflight: Dict[int, asyncio.Task]  # by publish seq no
+    __seq: int
+    __nacked: int
+    coalesce: float
+    coalesce_n: int
+    coalescer: Optional[Coalescer]
 
-    def __init__(self, host: str = 'amqp://localhost'):
+    def __init__(self, host: str = 'amqp://localhost', confirm: ConfirmMode = ConfirmMode.Each, window: int = WINDOW,
+                 consume: bool = False, prefetch: int = PREFETCH, conns: int = 1, chans: int = 1,
+                 coalesce: float = 0.0, coalesce_n: int = COALESCE_N, durability: Optional[Durability] = None):
+        """:param consume: get_all() by basic_consume instead of basic_get polling
+        :param conns: connections in pool
+        :param chans: channels per connection; queues are spread over all the channels by name hash
+        :param coalesce: s, put() waits for others up to that (0: off) or coalesce_n msgs; published back to back
+        :param durability: none: transient messages, others: persistent (fsync is up to the broker)
+        """
         super().__init__()
         self.__host = host
+        self.durability = durability or Durability()
+        self.conns = conns
+        self.chans = chans
+        self.confirm = confirm
+        self.consume = consume
+        self.prefetch = prefetch
+        self.__window = asyncio.Semaphore(window) if confirm == ConfirmMode.Window else None
+        self.__inflight = {}
+        self.__seq = self.__nacked = 0
+        self.__stats_chans = []
+        self.coalesce = coalesce
+        self.coalesce_n = coalesce_n
+        self.coalescer = None
+        if confirm != ConfirmMode.Each:
+            self.title = f"{self.title} [confirm={confirm.name}]"
+        if consume:
+            self.title = f"{self.title} [consume, prefetch={prefetch}]"
+        if conns * chans > 1:
+            self.title = f"{self.title} [pool={conns}×{chans}]"
+        if coalesce:
+            self.title = f"{self.title} [coalesce={coalesce * 1e6:g}µs/{coalesce_n}]"
 
     async def open(self, count: int):
         await super().open(count)
-        self.__conn = await aiormq.connect(self.__host)
-        self.chan = await self.__conn.channel()
-        await self.chan.confirm_delivery()  # publish confirm?
-        await self.chan.basic_qos(prefetch_count=1)  # get by 1
+        self.__properties = aiormq.spec.Basic.Properties(delivery_mode=2 if self.durability.persistent else 1)
+        self.__conns = await asyncio.gather(*[aiormq.connect(self.__host) for _ in range(self.conns)])
+        self.__chans = await asyncio.gather(*[
+            conn.channel(publisher_confirms=self.confirm != ConfirmMode.No)
+            for conn in self.__conns for _ in range(self.chans)
+        ])
+        await asyncio.gather(*[chan.basic_qos(prefetch_count=1) for chan in self.__chans])  # get by 1
+        self.__chan_load = collections.Counter(self.__chan_num(q_name(i)) for i in range(count))
+        if self.coalesce:
+            self.coalescer = Coalescer(self.__write, self.coalesce, self.coalesce_n)
+
+    def chan_of(self, key: str) -> aiormq.abc.AbstractChannel:
+        """Channel of the pool assigned to the queue."""
+        return self.__chans[self.__chan_num(key)]
+
+    def __chan_num(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % len(self.__chans)
+
+    def chan_shared(self, key: str) -> bool:
+        """Other queues are assigned to the channel of the queue too."""
+        return self.__chan_load[self.__chan_num(key)] > 1
+
+    async def consumer_channel(self, key: str) -> aiormq.abc.AbstractChannel:
+        """New channel on the connection the queue is assigned to."""
+        conn = self.__conns[zlib.crc32(key.encode()) % len(self.__chans) // self.chans]
+        chan = await conn.channel(publisher_confirms=False)
+        await chan.basic_qos(prefetch_count=self.prefetch)
+        return chan
+
+    async def stats(self) -> List[QStats]:
+        """Depths by passive declares pipelined over STATS_CHANS own channels."""
+        if not self.__stats_chans:
+            self.__stats_chans = await asyncio.gather(*[
+                self.__conns[i % len(self.__conns)].channel(publisher_confirms=False) for i in range(STATS_CHANS)
+            ])
+        qs = await asyncio.gather(*[self.q(i) for i in range(self._count)])
+
+        async def depths(chan: aiormq.abc.AbstractChannel, part: List[QA]):
+            for q in part:
+                q._st.depth = (await chan.queue_declare(queue=q._q_name, passive=True)).message_count
+
+        n = len(self.__stats_chans)
+        await asyncio.gather(*[depths(chan, qs[i::n]) for i, chan in enumerate(self.__stats_chans)])
+        return [q._st for q in qs]
+
+    async def publish(self, chan: aiormq.abc.AbstractChannel, routing_key: str, data: bytes):
+        """Publish according to confirm mode."""
+        coro = chan.basic_publish(body=data, routing_key=routing_key, properties=self.__properties)
+        if self.confirm <= ConfirmMode.Each:
+            if isinstance(await coro, aiormq.spec.Basic.Nack):
+                raise QExc(f"Nacked: {routing_key}")
+            return
+        if self.__window:
+            await self.__window.acquire()  # backpressure
+        self.__seq += 1
+        task = self.__inflight[self.__seq] = asyncio.create_task(coro)
+        task.add_done_callback(lambda t, seq=self.__seq: self.__confirmed(seq, t))
+
+    async def __write(self, burst: List[Tuple[Tuple[aiormq.abc.AbstractChannel, str], bytes]]):
+        """Coalesced puts: all the frames written back to back, then confirms (by mode) awaited together."""
+        await asyncio.gather(*[self.publish(chan, routing_key, data) for (chan, routing_key), data in burst])
+
+    def __confirmed(self, seq: int, task: asyncio.Task):
+        del self.__inflight[seq]
+        if self.__window:
+            self.__window.release()
+        if task.cancelled() or task.exception() or isinstance(task.result(), aiormq.spec.Basic.Nack):
+            self.__nacked += 1
+
+    async def flush(self):
+        """Wait for all the publishes in flight."""
+        if self.coalescer:
+            await self.coalescer.drain()
+        if self.__inflight:
+            await asyncio.wait(list(self.__inflight.values()))
+        if self.__nacked:
+            nacked, self.__nacked = self.__nacked, 0
+            raise QExc(f"Nacked: {nacked}")
 
     async def close(self):
-        await self.chan.close()
-        await self.__conn.close()
+        try:
+            await self.flush()
+        finally:
+            await super().close()  # queues are bound to the channels
+            await asyncio.gather(*[chan.close() for chan in self.__stats_chans + self.__chans])
+            self.__stats_chans = []
+            self.coalescer = None
+            await asyncio.gather(*[conn.close() for conn in self.__conns])
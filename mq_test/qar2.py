@@ -1,82 +1,262 @@
 """Queue Async RabbitMQ #2.
 Powered by [aio-pika](https://github.com/mosquito/aio-pika)
 """
-from typing import Optional
+import asyncio
+import collections
+import zlib
+from typing import Optional, Iterable, List, Deque, Dict, Tuple
 # 2. 3rd
 import aio_pika
 import aio_pika.abc
 # 3. local
-from q import QA, QAc
+from q import COALESCE_N, q_name, Durability, Delivery, Coalescer, QStats, QA, QAc
 # x. const
 GET_TIMEOUT = 1
+PREFETCH = 100  # consume mode
+IDLE_TIMEOUT = 1  # s, consume mode: stop if nothing comes
+STATS_CHANS = 16  # open()/stats(): passive declares in flight (one RPC at a time per channel)
 
 
 class _QAR2(QA):
     """Queue Async RabbitMQ (aio_pika)."""
     _master: 'QAR2c'  # to avoid editor inspection warning
+    __chan: aio_pika.abc.AbstractChannel
     __q: aio_pika.abc.AbstractQueue
+    __unacked: Optional[Deque[aio_pika.abc.AbstractIncomingMessage]]  # got by get_ack() if the channel is shared
 
     def __init__(self, master: 'QAR2c', __id: int):
         super().__init__(master, __id)
 
     async def open(self):
-        self.__q = await self._master.chan.get_queue(self._q_name)
+        """:note: no round trip: the container checks all the queues at once"""
+        self.__chan = self._master.chan_of(self._q_name)
+        self.__unacked = collections.deque() if self._master.chan_shared(self._q_name) else None
+        self.__q = await self.__chan.get_queue(self._q_name, ensure=False)
 
     async def count(self) -> int:
-        q = await self._master.chan.get_queue(self._q_name)
+        q = await self.__chan.get_queue(self._q_name)
         return q.declaration_result.message_count
 
     async def put(self, data: bytes):
-        await self._master.chan.default_exchange.publish(
-            message=aio_pika.Message(
-                body=data,
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-            ),
-            routing_key=self._q_name
-        )
+        if self._master.coalescer:
+            await self._master.coalescer.put((self.__chan.default_exchange, self._q_name), data)
+        else:
+            await self.__chan.default_exchange.publish(
+                message=aio_pika.Message(
+                    body=data,
+                    delivery_mode=self._master.delivery_mode,
+                ),
+                routing_key=self._q_name
+            )
+        self._st.put(1, len(data))
 
     async def get(self, wait: bool = True) -> Optional[bytes]:
         msg: aio_pika.abc.AbstractIncomingMessage = await self.__q.get(no_ack=True, fail=False, timeout=1)
         if msg:
-            return msg.body
+            return self._st.got1(msg.body)
+
+    async def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        msg: aio_pika.abc.AbstractIncomingMessage = await self.__q.get(no_ack=False, fail=False, timeout=1)
+        if msg:
+            if self.__unacked is not None:
+                self.__unacked.append(msg)
+            return Delivery(self._st.got1(msg.body), msg.delivery_tag, msg)
+
+    async def ack(self, d: Delivery, multiple: bool = False):
+        """:note: delivery tags are per channel: on a channel shared with other queues `multiple` acks
+        this queue's deliveries one by one (a multiple ack would take the others' too)
+        """
+        if (msgs := self.__unacked) is None:
+            await d.pos.ack(multiple=multiple)
+        elif multiple:
+            while msgs and msgs[0].delivery_tag <= d.tag:
+                await msgs.popleft().ack()
+        else:
+            msgs.remove(d.pos)
+            await d.pos.ack()
 
     async def get_all(self):
+        if self._master.consume:
+            await self.__get_all_consume()
+            return
         while await self.get():
             ...
 
+    async def __get_all_consume(self):
+        """Push-based: consume up to queue depth snapshot, ack by `multiple`.
+        Own channel, so `multiple` acks do not touch other consumers.
+        """
+        if not (count := await self.count()):
+            return
+        chan = await self._master.consumer_channel(self._q_name)
+        q = await chan.get_queue(self._q_name)
+        ack_every = max(1, self._master.prefetch // 2)
+        got = 0
+        last: Optional[aio_pika.abc.AbstractIncomingMessage] = None  # not acked yet
+        done = asyncio.get_running_loop().create_future()
+
+        async def on_msg(msg: aio_pika.abc.AbstractIncomingMessage):
+            nonlocal got, last
+            if got >= count:  # beyond the snapshot
+                await msg.nack(requeue=True)
+                return
+            got += 1
+            self._st.got1(msg.body)
+            last = msg
+            if got == count or not got % ack_every:
+                last = None
+                await msg.ack(multiple=True)
+            if got == count and not done.done():
+                done.set_result(None)
+
+        tag = await q.consume(on_msg, no_ack=False)
+        try:
+            while not done.done():
+                n = got
+                await asyncio.wait({done}, timeout=IDLE_TIMEOUT)
+                if got == n:  # stalled
+                    break
+            if last is not None:  # got (and counted) since the last ack
+                await last.ack(multiple=True)
+            await q.cancel(tag)
+        finally:
+            await chan.close()
+
+    async def put_many(self, data: Iterable[bytes]):
+        """Pipelined: all publishes in flight, then wait for confirms."""
+        exchange = self.__chan.default_exchange
+        data = list(data)
+        await asyncio.gather(*[
+            exchange.publish(
+                message=aio_pika.Message(body=item, delivery_mode=self._master.delivery_mode),
+                routing_key=self._q_name
+            )
+            for item in data
+        ])
+        self._st.put(len(data), sum(map(len, data)))
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while len(ret) < max_n and (item := await self.get()) is not None:
+            ret.append(item)
+        return ret
+
     async def close(self):
         ...
 
-    '''
-    async def __get_all_freeze(self):
-        async with self.__q.iterator() as q_iter:
-            # FIXME: Cancel consuming after __aexit__
-            async for msg in q_iter:
-                async with msg.process():
-                    print(f"Msg of {self._q_name}")
-                    # if msg.count == 0: break
-    '''
-
 
 class QAR2c(QAc):
     """RabbitMQ Async Queue Container."""
     title: str = "Queue Async (RabbitMQ (aio-pika))"
     _child_cls = _QAR2
     __host: str
-    __conn: aio_pika.abc.AbstractConnection
-    chan: aio_pika.abc.AbstractChannel
+    __conns: List[aio_pika.abc.AbstractConnection]
+    __chans: List[aio_pika.abc.AbstractChannel]  # conns × chans, conn-major
+    __chan_load: Dict[int, int]  # queues per channel
+    __stats_chans: List[aio_pika.abc.AbstractChannel]  # passive declares only
+    conns: int
+    chans: int  # per connection
+    consume: bool
+    prefetch: int
+    delivery_mode: aio_pika.DeliveryMode
+    coalesce: float
+    coalesce_n: int
+    coalescer: Optional[Coalescer]
 
-    def __init__(self, host: str = 'amqp://localhost'):
+    def __init__(self, host: str = 'amqp://localhost', consume: bool = False, prefetch: int = PREFETCH,
+                 conns: int = 1, chans: int = 1, coalesce: float = 0.0, coalesce_n: int = COALESCE_N,
+                 durability: Optional[Durability] = None):
+        """:param consume: get_all() by consume instead of basic_get polling
+        :param conns: connections in pool
+        :param chans: channels per connection; queues are spread over all the channels by name hash
+        :param coalesce: s, put() waits for others up to that (0: off) or coalesce_n msgs; published back to back
+        :param durability: none: transient messages, others: persistent (fsync is up to the broker)
+        """
         super().__init__()
         self.__host = host
+        self.durability = durability or Durability()
+        self.delivery_mode = aio_pika.DeliveryMode.PERSISTENT if self.durability.persistent \
+            else aio_pika.DeliveryMode.NOT_PERSISTENT
+        self.consume = consume
+        self.prefetch = prefetch
+        self.conns = conns
+        self.chans = chans
+        self.__stats_chans = []
+        self.coalesce = coalesce
+        self.coalesce_n = coalesce_n
+        self.coalescer = None
+        if consume:
+            self.title = f"{self.title} [consume, prefetch={prefetch}]"
+        if conns * chans > 1:
+            self.title = f"{self.title} [pool={conns}×{chans}]"
+        if coalesce:
+            self.title = f"{self.title} [coalesce={coalesce * 1e6:g}µs/{coalesce_n}]"
 
     async def open(self, count: int):
         await super().open(count)
-        self.__conn = await aio_pika.connect(self.__host)
-        self.chan = await self.__conn.channel()
-        self.chan.publisher_confirms = True
-        await self.chan.set_qos(prefetch_count=1)
+        self.__conns = await asyncio.gather(*[aio_pika.connect(self.__host) for _ in range(self.conns)])
+        self.__chans = await asyncio.gather(*[conn.channel() for conn in self.__conns for _ in range(self.chans)])
+        await asyncio.gather(*[chan.set_qos(prefetch_count=1) for chan in self.__chans])
+        self.__chan_load = collections.Counter(self.__chan_num(q_name(i)) for i in range(count))
+        await self.__declare(await asyncio.gather(*[self.q(i) for i in range(count)]))  # pre-open, check all
+        if self.coalesce:
+            self.coalescer = Coalescer(self.__write, self.coalesce, self.coalesce_n)
+
+    def chan_of(self, key: str) -> aio_pika.abc.AbstractChannel:
+        """Channel of the pool assigned to the queue."""
+        return self.__chans[self.__chan_num(key)]
+
+    def __chan_num(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % len(self.__chans)
+
+    def chan_shared(self, key: str) -> bool:
+        """Other queues are assigned to the channel of the queue too."""
+        return self.__chan_load[self.__chan_num(key)] > 1
+
+    async def consumer_channel(self, key: str) -> aio_pika.abc.AbstractChannel:
+        """New channel on the connection the queue is assigned to."""
+        conn = self.__conns[zlib.crc32(key.encode()) % len(self.__chans) // self.chans]
+        chan = await conn.channel(publisher_confirms=False)
+        await chan.set_qos(prefetch_count=self.prefetch)
+        return chan
+
+    async def __write(self, burst: List[Tuple[Tuple[aio_pika.abc.AbstractExchange, str], bytes]]):
+        """Coalesced puts: all the frames written back to back, then confirms awaited together."""
+        await asyncio.gather(*[
+            exchange.publish(
+                message=aio_pika.Message(body=data, delivery_mode=self.delivery_mode),
+                routing_key=routing_key
+            )
+            for (exchange, routing_key), data in burst
+        ])
+
+    async def flush(self):
+        if self.coalescer:
+            await self.coalescer.drain()
+
+    async def __declare(self, qs: List[QA]):
+        """Passive declares (queues must exist) pipelined over STATS_CHANS own channels; depths to stats."""
+        if not self.__stats_chans:
+            self.__stats_chans = await asyncio.gather(*[
+                self.__conns[i % len(self.__conns)].channel(publisher_confirms=False) for i in range(STATS_CHANS)
+            ])
+
+        async def depths(chan: aio_pika.abc.AbstractChannel, part: List[QA]):
+            for q in part:
+                q._st.depth = (await chan.get_queue(q._q_name)).declaration_result.message_count
+
+        n = len(self.__stats_chans)
+        await asyncio.gather(*[depths(chan, qs[i::n]) for i, chan in enumerate(self.__stats_chans)])
+
+    async def stats(self) -> List[QStats]:
+        qs = await asyncio.gather(*[self.q(i) for i in range(self._count)])
+        await self.__declare(qs)
+        return [q._st for q in qs]
 
     async def close(self):
-        await self.chan.close()
-        await self.__conn.close()
+        await self.flush()
+        self.coalescer = None
+        await super().close()  # queues are bound to the channels
+        await asyncio.gather(*[chan.close() for chan in self.__stats_chans + self.__chans])
+        self.__stats_chans = []
+        await asyncio.gather(*[conn.close() for conn in self.__conns])
@@ -1,21 +1,35 @@
 """Queue Sync Disk-based #1.
 Powered by [queuelib](https://github.com/scrapy/queuelib)
+:note: queuelib saves its index on close only; fsync (durability) covers the data chunk being written
+and the ones closed by roll-over since the last one
 """
 
-from typing import Iterator
+from typing import Iterator, Iterable, List, Optional
+import os
 
 import queuelib
 
-from q import QS, QSc
+from q import LockScope, Sync, Durability, SyncTrack, QS, QSc
 
 
 class _QSD1(QS):
     """Disk-based #1 Sync Queue."""
     __q: queuelib.FifoDiskQueue
+    __sync: SyncTrack
 
     def __init__(self, master: 'QSD1c', __id: int):
         super().__init__(master, __id)
         self.__q = queuelib.FifoDiskQueue(f"_d1sd/{__id:04d}")
+        self.__sync = master.durability.track()
+
+    def __synced(self, n: int, hnum: int):
+        """:param hnum: head chunk before the writes"""
+        if self.__sync.policy.sync > Sync.OS:
+            for num in range(hnum, self.__q.info['head'][0]):  # rolled over: closed w/o fsync
+                with self.__q._openchunk(num) as f:
+                    os.fsync(f.fileno())
+        if self.__sync.wrote(n):
+            os.fsync(self.__q.headf.fileno())
 
     def open(self):
         ...
@@ -24,28 +38,57 @@ class _QSD1(QS):
         return len(self.__q)
 
     def put(self, data: bytes):
-        return self.__q.push(data)
+        hnum = self.__q.info['head'][0]
+        self.__q.push(data)
+        self.__synced(1, hnum)
+        self._st.put(1, len(data))
 
     def get(self, wait: bool = True) -> bytes:
-        return self.__q.pop()
+        return self._st.got1(self.__q.pop())
 
     def get_all(self):
-        while self.__q.pop():
+        while self._st.got1(self.__q.pop()):
             ...
 
+    def put_many(self, data: Iterable[bytes]):
+        push = self.__q.push
+        hnum = self.__q.info['head'][0]
+        n = size = 0
+        for item in data:
+            push(item)
+            n += 1
+            size += len(item)
+        self.__synced(n, hnum)
+        self._st.put(n, size)
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        pop = self.__q.pop
+        while len(ret) < max_n and (item := pop()) is not None:
+            ret.append(item)
+        return self._st.got(ret)
+
     def __iter__(self) -> Iterator:
         return self
 
     def __next__(self) -> bytes:
-        if item := self.__q.pop() is None:
+        if (item := self._st.got1(self.__q.pop())) is None:
             raise StopIteration
         return item
 
     def close(self):
+        if self.__sync.pending():
+            os.fsync(self.__q.headf.fileno())
         self.__q.close()
 
 
 class QSD1c(QSc):
     """Disk-based #1 Sync Queue Container."""
     title: str = "Queue Sync (Disk (queuelib))"
+    lock_scope = LockScope.Queue
+    shared = True
     _child_cls = _QSD1
+
+    def __init__(self, durability: Optional[Durability] = None):
+        super().__init__()
+        self.durability = durability or Durability()
@@ -1,21 +1,31 @@
 """Queue Sync Disk-based #2.
 Powered by [persistqueue](https://github.com/peter-wangxu/persist-queue).
 :note: slow
+:note: persistqueue fsyncs a data chunk when full, its index is renamed in place w/o fsync
 """
-from typing import Iterator
+from typing import Iterator, Iterable, List, Optional
+import os
 # 2. 3rd
 import persistqueue
 # 3. local
-from q import QS, QSc
+from q import LockScope, Durability, SyncTrack, Delivery, AckTrack, QS, QSc
 
 
 class _QSD2(QS):
     """Disk-based #2 Sync Queue."""
     __q: persistqueue.Queue
+    __acks: AckTrack
+    __sync: SyncTrack
 
     def __init__(self, master: 'QSD2c', __id: int):
         super().__init__(master, __id)
         self.__q = persistqueue.Queue(f"_d2sd/{__id:04d}")  # FIXME: use .task_done()
+        self.__acks = AckTrack()
+        self.__sync = master.durability.track()
+
+    def __synced(self, n: int):
+        if self.__sync.wrote(n):
+            os.fsync(self.__q.headf.fileno())
 
     def open(self):
         ...
@@ -24,21 +34,58 @@ class _QSD2(QS):
         return self.__q.qsize()
 
     def put(self, data: bytes):
-        return self.__q.put(data)
+        self.__q.put(data)
+        self.__synced(1)
+        self._st.put(1, len(data))
 
     def get(self, wait: bool = True, save=True) -> bytes:
         item = self.__q.get(wait)
         if save:
             self.__q.task_done()
-        return item
+        return self._st.got1(item)
 
     def get_all(self):
         try:
-            while self.__q.get(False):
+            while self._st.got1(self.__q.get(False)):
                 ...
         except persistqueue.exceptions.Empty:
             self.__q.task_done()
 
+    def put_many(self, data: Iterable[bytes]):
+        """:note: persistqueue saves info on each put anyway."""
+        n = size = 0
+        for item in data:
+            self.__q.put(item)
+            n += 1
+            size += len(item)
+        self.__synced(n)
+        self._st.put(n, size)
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        """One commit (.task_done()) per batch."""
+        ret = []
+        try:
+            while len(ret) < max_n:
+                ret.append(self.__q.get(False))
+        except persistqueue.exceptions.Empty:
+            ...
+        if ret:
+            self.__q.task_done()
+        return self._st.got(ret)
+
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        try:
+            data = self.__q.get(wait)
+        except persistqueue.exceptions.Empty:
+            return None
+        return self.__acks.add(self._st.got1(data))
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        """.task_done() commits all the gets so far, so it waits for all of them acked."""
+        self.__acks.ack(d, multiple)
+        if not self.__acks:
+            self.__q.task_done()
+
     def __iter__(self) -> Iterator:
         return self
 
@@ -46,13 +93,20 @@ class _QSD2(QS):
         if self.__q.empty():
             self.__q.task_done()
             raise StopIteration
-        return self.__q.get()
+        return self._st.got1(self.__q.get())
 
     def close(self):
-        ...
+        if self.__sync.pending():
+            os.fsync(self.__q.headf.fileno())
 
 
 class QSD2c(QSc):
     """Disk-based #2 Sync Queue Container."""
     title: str = "Queue Sync (Disk (persistqueue))"
+    lock_scope = LockScope.No
+    shared = True
     _child_cls = _QSD2
+
+    def __init__(self, durability: Optional[Durability] = None):
+        super().__init__()
+        self.durability = durability or Durability()
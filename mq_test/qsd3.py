@@ -0,0 +1,256 @@
+"""Queue Sync Disk-based #3.
+Memory-mapped segmented ring log: fixed-size segment files + header with read/write cursors.
+Consumed segments are recycled (renamed) instead of being deleted and allocated again.
+Record: <len:u32><data>; len == 0xFFFFFFFF marks end of segment.
+"""
+# 1. std
+from typing import Iterator, Iterable, List, Optional, Tuple
+import mmap
+import os
+import struct
+# 3. local
+from q import QExc, LockScope, Sync, Durability, SyncTrack, Delivery, AckTrack, QS, QSc
+# x. const
+SEG_SIZE = 1 << 20  # bytes
+FREE_MAX = 4  # recycled segments kept
+_HDR = struct.Struct('<6Q')  # w_seg, w_off, r_seg, r_off, n_put, n_get
+_LEN = struct.Struct('<I')
+_END = 0xFFFFFFFF
+
+
+class _Seg:
+    """Mapped segment file."""
+    num: int
+    mm: mmap.mmap
+
+    def __init__(self, path: str, num: int, size: int):
+        self.num = num
+        with open(path, 'r+b') as f:
+            self.mm = mmap.mmap(f.fileno(), size, flags=mmap.MAP_SHARED)  # pages fault in as written/read
+
+    def flush(self, start: int = 0, end: Optional[int] = None):
+        start -= start % mmap.PAGESIZE
+        self.mm.flush(start, (len(self.mm) if end is None else end) - start)
+
+    def close(self):
+        self.mm.close()
+
+
+class _QSD3(QS):
+    """Disk-based #3 Sync Queue."""
+    _master: 'QSD3c'
+    __dir: str
+    __hdr: mmap.mmap
+    __w_seg: int
+    __w_off: int
+    __r_seg: int
+    __r_off: int
+    __n_put: int
+    __n_get: int
+    __w: Optional[_Seg]
+    __r: Optional[_Seg]
+    __free: List[str]
+    __saved: Tuple[int, int, int]  # read (segment, offset, n_get) in header; segments before it are recycled
+    __acks: AckTrack
+    __sync: SyncTrack
+    __synced: int  # write segment offset msync()'ed up to
+
+    def __init__(self, master: 'QSD3c', __id: int):
+        super().__init__(master, __id)
+        self.__dir = f"_d3sd/{__id:04d}"
+        self.__w = self.__r = None
+        self.__acks = AckTrack()
+        self.__sync = master.durability.track()
+
+    def __path(self, num: int) -> str:
+        return os.path.join(self.__dir, f"{num:08d}.seg")
+
+    def open(self):
+        os.makedirs(self.__dir, exist_ok=True)
+        path = os.path.join(self.__dir, 'head')
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(bytes(_HDR.size))
+        with open(path, 'r+b') as f:
+            self.__hdr = mmap.mmap(f.fileno(), _HDR.size)
+        self.__w_seg, self.__w_off, self.__r_seg, self.__r_off, self.__n_put, self.__n_get = _HDR.unpack(self.__hdr)
+        self.__saved = (self.__r_seg, self.__r_off, self.__n_get)
+        self.__free = sorted(os.path.join(self.__dir, name) for name in os.listdir(self.__dir)
+                             if name.endswith('.free'))
+        self.__w = self.__seg(self.__w_seg)
+        self.__synced = self.__w_off
+
+    def __seg(self, num: int) -> _Seg:
+        """Map segment (create or reuse a recycled one)."""
+        path = self.__path(num)
+        if not os.path.exists(path):
+            if self.__free:
+                os.rename(self.__free.pop(), path)
+            else:
+                with open(path, 'wb') as f:
+                    if hasattr(os, 'posix_fallocate'):  # allocate blocks now, not on page fault
+                        os.posix_fallocate(f.fileno(), 0, self._master.seg_size)
+                    else:
+                        f.truncate(self._master.seg_size)
+        return _Seg(path, num, self._master.seg_size)
+
+    def __recycle(self, num: int):
+        """Move consumed segment to free pool."""
+        path = self.__path(num)
+        if len(self.__free) < FREE_MAX:
+            free = f"{path}.free"
+            os.rename(path, free)
+            self.__free.append(free)
+        else:
+            os.remove(path)
+
+    def __save(self, cursor: Optional[Tuple[int, int, int]] = None):
+        """Save header; recycle segments behind saved read cursor.
+        :param cursor: new read (segment, offset, n_get) to save; default - the saved one (acks pending)
+        """
+        if cursor:
+            for num in range(self.__saved[0], cursor[0]):
+                self.__recycle(num)
+            self.__saved = cursor
+        _HDR.pack_into(self.__hdr, 0, self.__w_seg, self.__w_off, *self.__saved[:2], self.__n_put, self.__saved[2])
+
+    def __consumed(self):
+        """Save current read cursor."""
+        self.__save((self.__r_seg, self.__r_off, self.__n_get))
+
+    def count(self) -> int:
+        return self.__n_put - self.__n_get
+
+    def __roll(self, n: int):
+        """Close write segment with end mark, start next one."""
+        if n + 2 * _LEN.size > self._master.seg_size:
+            raise QExc(f"Message too big: {n}")
+        _LEN.pack_into(self.__w.mm, self.__w_off, _END)
+        if self._master.durability.sync > Sync.OS:  # the rest of it
+            self.__w.flush(self.__synced)
+        if self.__w is not self.__r:
+            self.__w.close()
+        self.__w_seg += 1
+        self.__w_off = self.__synced = 0
+        self.__w = self.__seg(self.__w_seg)
+
+    def __put(self, data: bytes):
+        n = len(data)
+        off = self.__w_off
+        end = off + _LEN.size + n
+        if end + _LEN.size > self._master.seg_size:  # no room for record and end mark
+            self.__roll(n)
+            off, end = 0, _LEN.size + n
+        mm = self.__w.mm
+        _LEN.pack_into(mm, off, n)
+        mm[off + _LEN.size:end] = data
+        self.__w_off = end
+        self.__n_put += 1
+        self._st.put(1, n)
+
+    def __flush(self, n: int):
+        """Save header; msync() written since the last one and header if due."""
+        self.__save()
+        if self.__sync.wrote(n):
+            self.__w.flush(self.__synced, self.__w_off)
+            self.__synced = self.__w_off
+            self.__hdr.flush()
+
+    def put(self, data: bytes):
+        self.__put(data)
+        self.__flush(1)
+
+    def put_many(self, data: Iterable[bytes]):
+        n = 0
+        for item in data:
+            self.__put(item)
+            n += 1
+        self.__flush(n)
+
+    def __get(self) -> Optional[bytes]:
+        while True:
+            if self.__r_seg == self.__w_seg and self.__r_off >= self.__w_off:
+                return None
+            if self.__r is None:
+                self.__r = self.__w if self.__r_seg == self.__w_seg else self.__seg(self.__r_seg)
+            mm, off = self.__r.mm, self.__r_off
+            n = _LEN.unpack_from(mm, off)[0] if off + _LEN.size <= len(mm) else _END
+            if n != _END:
+                self.__r_off = off + _LEN.size + n
+                self.__n_get += 1
+                return self._st.got1(mm[off + _LEN.size:self.__r_off])
+            self.__r.close()  # segment consumed; recycled when saved
+            self.__r = None
+            self.__r_seg += 1
+            self.__r_off = 0
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        """:note: wait not used."""
+        ret = self.__get()
+        if ret is not None:
+            self.__consumed()
+        return ret
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while len(ret) < max_n and (item := self.__get()) is not None:
+            ret.append(item)
+        if ret:
+            self.__consumed()
+        return ret
+
+    def get_all(self):
+        """Skip to the write cursor."""
+        if self.__r and self.__r is not self.__w:
+            self.__r.close()
+        self.__r = None
+        self._st.n_get += self.__n_put - self.__n_get  # skipped, sizes unknown
+        self.__r_seg, self.__r_off, self.__n_get = self.__w_seg, self.__w_off, self.__n_put
+        self.__acks = AckTrack()
+        self.__consumed()
+
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Read cursor is saved on ack only.
+        :note: wait not used.
+        """
+        if (data := self.__get()) is not None:
+            return self.__acks.add(data, (self.__r_seg, self.__r_off, self.__n_get))
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        if last := self.__acks.ack(d, multiple):
+            self.__save(last.pos)
+            if self._master.durability.sync == Sync.Each:
+                self.__hdr.flush()
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> bytes:
+        if (item := self.get()) is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        if self._master.durability.sync > Sync.OS:
+            self.__w.flush(self.__synced)
+            self.__hdr.flush()
+        if self.__r and self.__r is not self.__w:
+            self.__r.close()
+        self.__w.close()
+        self.__hdr.close()
+        self.__w = self.__r = None
+
+
+class QSD3c(QSc):
+    """Disk-based #3 Sync Queue Container."""
+    title: str = "Queue Sync (Disk (mmap ring log))"
+    lock_scope = LockScope.Queue
+    shared = True
+    _child_cls = _QSD3
+    seg_size: int
+
+    def __init__(self, seg_size: int = SEG_SIZE, durability: Optional[Durability] = None):
+        """:param durability: msync() policy (Count/Time/Each: also the rest of a segment on switch and on close)"""
+        super().__init__()
+        self.seg_size = seg_size
+        self.durability = durability or Durability()
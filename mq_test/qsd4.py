@@ -0,0 +1,173 @@
+"""Queue Sync Disk-based #4.
+Powered by [sqlite3](https://docs.python.org/3/library/sqlite3.html): one WAL-mode database for all the queues,
+table keyed by (queue id, seq); batches are single transactions.
+:note: statements are constant strings, so sqlite3 prepares each once (statement cache)
+"""
+# 1. std
+from typing import Iterator, Iterable, List, Optional, Deque, Tuple
+import collections
+import os
+import sqlite3
+# 3. local
+from q import Sync, Durability, SyncTrack, Delivery, QStats, QS, QSc
+# x. const
+DB_PATH = '_d4sd/q.db'
+PREFETCH = 100  # get_ack() read ahead
+_DDL = (
+    "CREATE TABLE IF NOT EXISTS q (qid INTEGER NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, "
+    "PRIMARY KEY (qid, seq)) WITHOUT ROWID",
+    # last seq per queue: seqs are not reused when a queue gets empty
+    "CREATE TABLE IF NOT EXISTS last (qid INTEGER PRIMARY KEY, seq INTEGER NOT NULL)",
+    "CREATE TRIGGER IF NOT EXISTS q_seq AFTER INSERT ON q BEGIN "
+    "INSERT INTO last (qid, seq) VALUES (NEW.qid, NEW.seq) ON CONFLICT (qid) DO UPDATE SET seq = excluded.seq; END",
+)
+_COUNT = "SELECT COUNT(*) FROM q WHERE qid = ?"
+_COUNT_ALL = "SELECT qid, COUNT(*) FROM q GROUP BY qid"
+_PUT = "INSERT INTO q (qid, seq, data) VALUES (?1, (SELECT IFNULL(MAX(seq), 0) + 1 FROM last WHERE qid = ?1), ?2)"
+_GET = "DELETE FROM q WHERE qid = ?1 AND seq IN (SELECT seq FROM q WHERE qid = ?1 ORDER BY seq LIMIT ?2) " \
+       "RETURNING seq, data"
+_GET_ALL = "DELETE FROM q WHERE qid = ?"
+_PEEK = "SELECT seq, data FROM q WHERE qid = ? AND seq > ? ORDER BY seq LIMIT ?"
+_ACK = "DELETE FROM q WHERE qid = ? AND seq = ?"
+_ACK_TO = "DELETE FROM q WHERE qid = ? AND seq <= ?"
+
+
+class _QSD4(QS):
+    """Disk-based #4 Sync Queue."""
+    _master: 'QSD4c'
+    __last: int  # seq delivered by get_ack()
+    __ahead: Deque[Tuple[int, bytes]]  # read ahead
+
+    def __init__(self, master: 'QSD4c', __id: int):
+        super().__init__(master, __id)
+        self.__last = 0
+        self.__ahead = collections.deque()
+
+    def open(self):
+        ...
+
+    def count(self) -> int:
+        return self._master.db.execute(_COUNT, (self._id,)).fetchone()[0]
+
+    def put(self, data: bytes):
+        self._master.db.execute(_PUT, (self._id, data))  # autocommit
+        self._master.wrote(1)
+        self._st.put(1, len(data))
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        """:note: wait not used."""
+        if ret := self.get_many(1):
+            return ret[0]
+
+    def get_all(self):
+        self._st.n_get += self._master.db.execute(_GET_ALL, (self._id,)).rowcount  # sizes unknown
+
+    def put_many(self, data: Iterable[bytes]):
+        """One transaction."""
+        db = self._master.db
+        data = list(data)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(_PUT, ((self._id, item) for item in data))
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        self._master.wrote(len(data))
+        self._st.put(len(data), sum(map(len, data)))
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        """One statement (so transaction); RETURNING order is not defined."""
+        rows = self._master.db.execute(_GET, (self._id, max_n)).fetchall()
+        rows.sort()
+        return self._st.got([data for _, data in rows])
+
+    def get_ack(self, wait: bool = True) -> Optional[Delivery]:
+        """Rows stay until ack; tag is seq.
+        :note: wait not used.
+        """
+        if not self.__ahead:
+            self.__ahead.extend(self._master.db.execute(_PEEK, (self._id, self.__last, PREFETCH)).fetchall())
+            if not self.__ahead:
+                return None
+        self.__last, data = self.__ahead.popleft()
+        return Delivery(self._st.got1(data), self.__last)
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        """One DELETE for any number of messages."""
+        self._master.db.execute(_ACK_TO if multiple else _ACK, (self._id, d.tag))
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> bytes:
+        if (item := self.get()) is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        ...
+
+
+class QSD4c(QSc):
+    """Disk-based #4 Sync Queue Container."""
+    title: str = "Queue Sync (Disk (SQLite WAL))"
+    shared = True
+    _child_cls = _QSD4
+    path: str
+    synchronous: str
+    db: sqlite3.Connection
+    __sync: SyncTrack
+
+    def __init__(self, path: str = DB_PATH, durability: Optional[Durability] = None):
+        """:param durability: PRAGMA synchronous: OFF (No), NORMAL (OS: WAL is synced on checkpoint only),
+        FULL (Each: WAL synced on each commit); Count/Time: NORMAL + WAL fsync() when due (one for all the queues)
+        """
+        super().__init__()
+        self.path = path
+        self.durability = durability or Durability()
+        self.synchronous = {Sync.No: 'OFF', Sync.Each: 'FULL'}.get(self.durability.sync, 'NORMAL')
+        self.__sync = self.durability.track()
+
+    def open(self, count: int):
+        super().open(count)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # isolation_level=None: autocommit, explicit BEGIN for batches
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={self.synchronous}")
+        for ddl in _DDL:
+            self.db.execute(ddl)
+
+    def wrote(self, n: int):
+        """n msgs committed: fsync() WAL if due."""
+        if self.__sync.wrote(n):
+            self.__fsync_wal()
+
+    def __fsync_wal(self):
+        fd = os.open(f"{self.path}-wal", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def stats(self) -> List[QStats]:
+        """Depths of all the queues by one query."""
+        depth = dict(self.db.execute(_COUNT_ALL).fetchall())
+        ret = []
+        for i in range(self._count):
+            st = self.q(i)._st
+            st.depth = depth.get(i, 0)
+            ret.append(st)
+        return ret
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('db', None)
+        return state
+
+    def close(self):
+        super().close()
+        if self.__sync.pending():
+            self.__fsync_wal()
+        self.db.close()
@@ -0,0 +1,278 @@
+"""Queue Hybrid (memory + spill), sync and async.
+Hot head in memory; under pressure the cold tail goes to an append-only spill file by segments.
+Order: hot deque -> spilled segments (oldest first) -> tail buffer (being gathered into the next segment).
+Segments are read back whole (one pread), the next one is prefetched (posix_fadvise WILLNEED).
+The spill file is scratch (not durable): truncated when drained and on open.
+Record: <len:u32><data>.
+"""
+# 1. std
+from typing import Iterator, Iterable, List, Optional, Deque, Tuple, Union
+import collections
+import os
+import struct
+# 3. local
+from q import QExc, LockScope, QStats, QS, QSc, QA, QAc
+# x. const
+HOT_SIZE = 1 << 20  # bytes in memory before spilling
+SEG_SIZE = 1 << 18  # spill segment, bytes
+SPILL_DIR = '_hsd'
+_LEN = struct.Struct('<I')
+
+
+class _Hybrid:
+    """Hot deque + spilled segments + tail buffer of a queue (the storage of both flavours)."""
+    __master: Union['QSHc', 'QAHc']
+    __path: str
+    __hot: Deque[bytes]
+    __hot_size: int
+    __tail: List[bytes]
+    __tail_size: int
+    __segs: Deque[Tuple[int, int, int]]  # spilled: offset, size, messages
+    __n_spilled: int
+    __fd: int
+    __w_off: int  # spill file end
+
+    def __init__(self, master: Union['QSHc', 'QAHc'], q_name: str):
+        self.__master = master
+        self.__path = os.path.join(master.path, f"{q_name}.spill")
+        self.__hot = collections.deque()
+        self.__tail = []
+        self.__segs = collections.deque()
+        self.__hot_size = self.__tail_size = self.__n_spilled = self.__w_off = 0
+        self.__fd = -1
+
+    def open(self):
+        os.makedirs(self.__master.path, exist_ok=True)
+        self.__fd = os.open(self.__path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def count(self) -> int:
+        return len(self.__hot) + self.__n_spilled + len(self.__tail)
+
+    def put_many(self, data: Iterable[bytes]) -> Tuple[int, int]:
+        """:return: messages, bytes put"""
+        hot_size, seg_size = self.__master.hot_size, self.__master.seg_size
+        count = size = 0
+        for item in data:
+            n = len(item)
+            count += 1
+            size += n
+            if not self.__segs and not self.__tail and self.__hot_size + n <= hot_size:
+                self.__hot.append(item)
+                self.__hot_size += n
+                continue
+            self.__tail.append(item)
+            self.__tail_size += _LEN.size + n
+            if self.__tail_size >= seg_size:
+                self.__spill()
+        return count, size
+
+    def __spill(self):
+        """Write tail buffer as a segment."""
+        buf = bytearray()
+        for item in self.__tail:
+            buf += _LEN.pack(len(item))
+            buf += item
+        view = memoryview(buf)
+        off = self.__w_off
+        while view:
+            view = view[os.pwrite(self.__fd, view, off + len(buf) - len(view)):]
+        self.__segs.append((off, len(buf), len(self.__tail)))
+        self.__w_off += len(buf)
+        self.__n_spilled += len(self.__tail)
+        self.__tail = []
+        self.__tail_size = 0
+
+    def __refill(self) -> bool:
+        """Hot is empty: load the oldest segment (else take the tail).
+        :return: something loaded
+        """
+        if self.__segs:
+            off, size, count = self.__segs.popleft()
+            buf = os.pread(self.__fd, size, off)
+            if len(buf) != size:
+                raise QExc(f"Spill segment {off}+{size}: short read {len(buf)}")
+            if self.__segs and hasattr(os, 'posix_fadvise'):  # sequential readahead of the next one
+                n_off, n_size, _ = self.__segs[0]
+                os.posix_fadvise(self.__fd, n_off, n_size, os.POSIX_FADV_WILLNEED)
+            view = memoryview(buf)
+            pos = 0
+            for _ in range(count):
+                n = _LEN.unpack_from(view, pos)[0]
+                pos += _LEN.size
+                self.__hot.append(bytes(view[pos:pos + n]))
+                self.__hot_size += n
+                pos += n
+            self.__n_spilled -= count
+            if not self.__segs:  # drained: reclaim
+                os.ftruncate(self.__fd, 0)
+                self.__w_off = 0
+            return True
+        if self.__tail:
+            self.__hot.extend(self.__tail)
+            self.__hot_size += self.__tail_size - _LEN.size * len(self.__tail)
+            self.__tail = []
+            self.__tail_size = 0
+            return True
+        return False
+
+    def get(self) -> Optional[bytes]:
+        if self.__hot or self.__refill():
+            data = self.__hot.popleft()
+            self.__hot_size -= len(data)
+            return data
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while len(ret) < max_n and (self.__hot or self.__refill()):
+            hot = self.__hot
+            for _ in range(min(max_n - len(ret), len(hot))):
+                ret.append(hot.popleft())
+        self.__hot_size -= sum(map(len, ret))
+        return ret
+
+    def drop_all(self) -> Tuple[int, int]:
+        """:return: messages, bytes dropped"""
+        ret = self.count(), self.__hot_size + self.__tail_size - _LEN.size * len(self.__tail) \
+            + sum(size - _LEN.size * count for _, size, count in self.__segs)
+        self.__hot.clear()
+        self.__tail.clear()
+        self.__segs.clear()
+        self.__hot_size = self.__tail_size = self.__n_spilled = self.__w_off = 0
+        os.ftruncate(self.__fd, 0)
+        return ret
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            os.remove(self.__path)
+            self.__fd = -1
+
+
+def _dropped(st: QStats, n_b: Tuple[int, int]):
+    st.n_get += n_b[0]
+    st.b_get += n_b[1]
+
+
+# == Sync ==
+class _QSH(QS):
+    """Hybrid Sync Queue."""
+    _master: 'QSHc'
+    __h: _Hybrid
+
+    def __init__(self, master: 'QSHc', __id: int):
+        super().__init__(master, __id)
+        self.__h = _Hybrid(master, self._q_name)
+
+    def open(self):
+        self.__h.open()
+
+    def count(self) -> int:
+        return self.__h.count()
+
+    def put(self, data: bytes):
+        self.put_many((data,))
+
+    def put_many(self, data: Iterable[bytes]):
+        self._st.put(*self.__h.put_many(data))
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        """:note: wait not used."""
+        return self._st.got1(self.__h.get())
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        return self._st.got(self.__h.get_many(max_n))
+
+    def get_all(self):
+        _dropped(self._st, self.__h.drop_all())
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> bytes:
+        if (item := self.get()) is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        self.__h.close()
+
+
+class QSHc(QSc):
+    """Hybrid (memory + spill) Sync Queue Container.
+    :note: in-process only; spill file is scratch
+    """
+    title: str = "Queue Sync (Memory+spill)"
+    lock_scope = LockScope.Queue
+    _child_cls = _QSH
+    hot_size: int
+    seg_size: int
+    path: str
+
+    def __init__(self, hot_size: int = HOT_SIZE, seg_size: int = SEG_SIZE, path: str = SPILL_DIR):
+        """:param hot_size: memory bytes per queue before spilling
+        :param seg_size: spill segment bytes (memory for the tail buffer and for a segment read back)
+        :param path: spill files dir
+        """
+        super().__init__()
+        self.hot_size = hot_size
+        self.seg_size = seg_size
+        self.path = path
+
+
+# == Async ==
+class _QAH(QA):
+    """Hybrid Async Queue.
+    :note: spill I/O is sync (in the loop), as of a local disk
+    """
+    _master: 'QAHc'
+    __h: _Hybrid
+
+    def __init__(self, master: 'QAHc', __id: int):
+        super().__init__(master, __id)
+        self.__h = _Hybrid(master, self._q_name)
+
+    async def open(self):
+        self.__h.open()
+
+    async def count(self) -> int:
+        return self.__h.count()
+
+    async def put(self, data: bytes):
+        await self.put_many((data,))
+
+    async def put_many(self, data: Iterable[bytes]):
+        self._st.put(*self.__h.put_many(data))
+
+    async def get(self, wait: bool = True) -> Optional[bytes]:
+        """:note: wait not used."""
+        return self._st.got1(self.__h.get())
+
+    async def get_many(self, max_n: int) -> List[bytes]:
+        return self._st.got(self.__h.get_many(max_n))
+
+    async def get_all(self):
+        _dropped(self._st, self.__h.drop_all())
+
+    async def close(self):
+        self.__h.close()
+
+
+class QAHc(QAc):
+    """Hybrid (memory + spill) Async Queue Container.
+    :note: in-process only; spill file is scratch
+    """
+    title: str = "Queue Async (Memory+spill)"
+    _child_cls = _QAH
+    hot_size: int
+    seg_size: int
+    path: str
+
+    def __init__(self, hot_size: int = HOT_SIZE, seg_size: int = SEG_SIZE, path: str = SPILL_DIR):
+        """:param hot_size: memory bytes per queue before spilling
+        :param seg_size: spill segment bytes (memory for the tail buffer and for a segment read back)
+        :param path: spill files dir
+        """
+        super().__init__()
+        self.hot_size = hot_size
+        self.seg_size = seg_size
+        self.path = path
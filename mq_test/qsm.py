@@ -1,51 +1,142 @@
 """Queue Sync in-Memory.
 Powered by [stdlib](https://docs.python.org/3/library/queue.html)
 """
-from typing import Optional, Iterator
+from typing import Optional, Iterator, Iterable, List
 import queue
 
-from q import QS, QSc
+from q import LockScope, Limit, SGate, QS, QSc
+# x. const
+WAIT_TICK = 0.1  # s, bounded blocking get(): spill re-check period
 
 
 class _QSM(QS):
     """Memory Sync Queue.
 
     """
+    _master: 'QSMC'
     __q: queue.SimpleQueue
+    __limit: Limit
+    __spill: Optional[QS]
+    __spilled: int  # messages in spill (all newer than in memory)
 
     def __init__(self, master: 'QSMC', __id: int):
         super().__init__(master, __id)
         self.__q = queue.SimpleQueue()
+        self.__limit = master.q_limit.copy()
+        self.__spill = None
+        self.__spilled = 0
 
     def open(self):
-        ...
+        if self._master.spill:
+            self.__spill = self._master.spill.q(self._id)
+            self.__spilled = self.__spill.count()
 
     def count(self) -> int:
-        return self.__q.qsize()
+        return self.__q.qsize() + self.__spilled
 
     def put(self, data: bytes):
-        self.__q.put(data)
+        if self._master.gate:
+            self.put_many((data,))
+        else:
+            self.__q.put(data)
+            self._st.put(1, len(data))
 
     def get(self, wait: bool = True) -> Optional[bytes]:
+        if self._master.gate:
+            return self.__get_bounded(wait)
         try:
-            return self.__q.get(block=wait, timeout=None)
+            return self._st.got1(self.__q.get(block=wait, timeout=None))
         except queue.Empty:
             return None
 
+    def __get_bounded(self, wait: bool) -> Optional[bytes]:
+        while not (ret := self.get_many(1)):
+            if not wait:
+                return None
+            try:
+                data = self.__q.get(timeout=WAIT_TICK)  # or spilled meanwhile (container limit)
+            except queue.Empty:
+                continue
+            self.__freed([data])
+            return self._st.got1(data)
+        return ret[0]
+
     def get_all(self):
+        if self._master.gate:
+            while self.get_many(1 << 10):
+                ...
+            return
         try:
-            while self.__q.get(block=False):
+            while self._st.got1(self.__q.get(block=False)):
                 ...
         except queue.Empty:
             return
 
+    def put_many(self, data: Iterable[bytes]):
+        """Bounded: wait for room or spill (all the rest, to keep FIFO)."""
+        if not (gate := self._master.gate):
+            n = size = 0
+            for item in data:
+                self.__q.put(item)
+                n += 1
+                size += len(item)
+            self._st.put(n, size)
+            return
+        limit = self.__limit
+        over = []
+        n = b = 0  # put to memory
+        with gate.cond:
+            for item in data:
+                size = len(item)
+                if not over and not self.__spilled:
+                    if not self.__spill:
+                        gate.wait(limit, size)
+                    if gate.fits(limit, size):
+                        gate.add(limit, 1, size)
+                        self.__q.put(item)
+                        n += 1
+                        b += size
+                        continue
+                over.append(item)
+            if over:
+                self.__spill.put_many(over)
+                self.__spilled += len(over)
+            self._st.put(n + len(over), b + sum(map(len, over)))
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        """Bounded: memory first, then spill."""
+        ret = []
+        try:
+            while len(ret) < max_n:
+                ret.append(self.__q.get_nowait())
+        except queue.Empty:
+            ...
+        if self._master.gate:
+            self.__freed(ret, max_n)
+        return self._st.got(ret)
+
+    def __freed(self, got: List[bytes], max_n: int = 0):
+        """Release room of got from memory, add from spill up to max_n."""
+        gate = self._master.gate
+        with gate.cond:
+            if got:
+                gate.add(self.__limit, -len(got), -sum(map(len, got)))
+            if self.__spilled and len(got) < max_n:
+                more = self.__spill.get_many(max_n - len(got))
+                self.__spilled -= len(more)
+                got.extend(more)
+
     def __iter__(self) -> Iterator:
         return self
 
     def __next__(self) -> bytes:
+        if self._master.gate:
+            if (item := self.get(False)) is None:
+                raise StopIteration
+            return item
         if self.__q.empty():  # not guaranied
             raise StopIteration
-        return self.__q.get()
+        return self._st.got1(self.__q.get())
 
     def close(self):
         ...
@@ -54,4 +145,44 @@ class _QSM(QS):
 class QSMC(QSc):
     """Memory Sync Queue Container."""
     title: str = "Queue Sync (Memory)"
+    lock_scope = LockScope.No
     _child_cls = _QSM
+    q_limit: Limit
+    c_limit: Limit
+    spill: Optional[QSc]
+    gate: Optional[SGate]
+
+    def __init__(self, q_limit: Optional[Limit] = None, c_limit: Optional[Limit] = None,
+                 spill: Optional[QSc] = None):
+        """:param q_limit: per queue ceiling (put() waits for room)
+        :param c_limit: all the queues ceiling
+        :param spill: overflow container (put() spills instead of waiting; FIFO: newer follow while any spilled)
+        """
+        super().__init__()
+        self.q_limit = q_limit or Limit()
+        self.c_limit = c_limit or Limit()
+        self.spill = spill
+        self.gate = None
+        if self.q_limit or self.c_limit:
+            notes = ', '.join(filter(None, (f"q≤{self.q_limit}" if self.q_limit else None,
+                                            f"c≤{self.c_limit}" if self.c_limit else None,
+                                            'spill' if spill else None)))
+            self.title = f"{self.title} [{notes}]"
+
+    def open(self, count: int):
+        super().open(count)
+        if self.q_limit or self.c_limit:
+            self.gate = SGate(self.c_limit)
+            if self.spill:
+                self.spill.open(count)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['gate'] = None
+        return state
+
+    def close(self):
+        super().close()
+        if self.gate and self.spill:
+            self.spill.close()
+        self.gate = None
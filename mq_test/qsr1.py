@@ -2,23 +2,28 @@
 Powered by [pika](https://pika.readthedocs.io/en/stable/index.html)
 """
 # 1. std
-from typing import Optional
+from typing import Optional, Iterable, List, Deque
+import collections
 # 2. 3rd
 import pika
 # 3. local
-from q import QS, QSc
+from q import Durability, Delivery, QS, QSc
+# x. const
+PREFETCH = 100  # consume mode
+IDLE_TIMEOUT = 1  # s, consume mode: stop if nothing comes
 
 
 # == Sync ==
 class _QSR(QS):
     """Queue Sync (RabbitMQ (pika))."""
     _master: 'QSRc'  # to avoid editor inspection warning
+    __unacked: Optional[Deque[int]]  # delivery tags got by get_ack() if the channel is shared
 
     def __init__(self, master: 'QSRc', __id: int):
         super().__init__(master, __id)
 
     def open(self):
-        ...
+        self.__unacked = collections.deque() if self._master.chan_shared() else None
 
     def count(self) -> int:
         return self._master.chan.queue_declare(queue=self._q_name, passive=True).method.message_count
@@ -28,8 +33,9 @@ class _QSR(QS):
             exchange='',
             routing_key=self._q_name,
             body=data,
-            properties=pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE)
+            properties=self._master.properties
         )
+        self._st.put(1, len(data))
 
     def get(self, _: bool = True) -> Optional[bytes]:
         """wait not used.
@@ -38,46 +44,146 @@ class _QSR(QS):
         # method, properties, body
         method, _, body = self._master.chan.basic_get(self._q_name, auto_ack=True)
         if method:  # not None?
-            return body
+            return self._st.got1(body)
+
+    def get_ack(self, _: bool = True) -> Optional[Delivery]:
+        """wait not used."""
+        method, _, body = self._master.chan.basic_get(self._q_name, auto_ack=False)
+        if method:
+            if self.__unacked is not None:
+                self.__unacked.append(method.delivery_tag)
+            return Delivery(self._st.got1(body), method.delivery_tag)
+
+    def ack(self, d: Delivery, multiple: bool = False):
+        """:note: delivery tags are per channel: as the channel is shared by all the container's queues,
+        `multiple` acks this queue's deliveries one by one (a multiple ack would take the others' too)
+        """
+        chan = self._master.chan
+        if (tags := self.__unacked) is None:
+            chan.basic_ack(d.tag, multiple)
+        elif multiple:
+            while tags and tags[0] <= d.tag:
+                chan.basic_ack(tags.popleft())
+        else:
+            tags.remove(d.tag)
+            chan.basic_ack(d.tag)
 
     def get_all(self):
+        if self._master.consume:
+            self.__get_all_consume()
+            return
         while self.get():
             ...
 
+    def __get_all_consume(self):
+        """Push-based: consume up to queue depth snapshot, ack by `multiple`.
+        Own channel, so `multiple` acks do not touch other consumers.
+        """
+        if not (count := self.count()):
+            return
+        chan = self._master.consumer_channel()
+        ack_every = max(1, self._master.prefetch // 2)
+        got = 0
+        last = None  # delivery tag not acked yet
+        try:
+            # method, properties, body
+            for method, _, body in chan.consume(self._q_name, inactivity_timeout=IDLE_TIMEOUT):
+                if method is None:  # stalled
+                    break
+                got += 1
+                self._st.got1(body)
+                last = method.delivery_tag
+                if got == count or not got % ack_every:
+                    chan.basic_ack(last, multiple=True)
+                    last = None
+                if got == count:
+                    break
+            if last is not None:
+                chan.basic_ack(last, multiple=True)
+            chan.cancel()  # rejects prefetched beyond the snapshot
+        finally:
+            chan.close()
+
+    def put_many(self, data: Iterable[bytes]):
+        """Pipelined: publishes w/o waiting for each confirm, one tx.commit round trip."""
+        chan = self._master.tx_chan
+        properties = self._master.properties
+        n = size = 0
+        for item in data:
+            chan.basic_publish(exchange='', routing_key=self._q_name, body=item, properties=properties)
+            n += 1
+            size += len(item)
+        chan.tx_commit()
+        self._st.put(n, size)
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        ret = []
+        while len(ret) < max_n and (item := self.get()) is not None:
+            ret.append(item)
+        return ret
+
     def close(self):
         ...
 
-    '''
-    def __get_all_freeze(self):
-        """Bsd implementation (requires strict counter)"""
-        count = self.count()
-        # method, properties, body
-        for _, __, ___ in self._master.chan.consume(self._q_name, auto_ack=True):
-            count -= 1
-            if not count:
-                self._master.chan.cancel()
-    '''
-
 
 class QSRc(QSc):
-    """Queue Sync RabbitMQ Container."""
+    """Queue Sync RabbitMQ Container.
+    :note: stats() declares one by one: a blocking channel waits for each reply
+    """
     title: str = "Queue Sync (RabbitMQ (pika))"
+    shared = True
     _child_cls = _QSR
     __host: str
+    __port: int
     __conn: pika.BlockingConnection
     chan: pika.adapters.blocking_connection.BlockingChannel
+    tx_chan: pika.adapters.blocking_connection.BlockingChannel  # for bulk put
+    consume: bool
+    prefetch: int
+    properties: pika.BasicProperties
 
-    def __init__(self, host: str = ''):  # '' == 'localhost'
+    def __init__(self, host: str = '', port: int = 5672, consume: bool = False, prefetch: int = PREFETCH,
+                 durability: Optional[Durability] = None):
+        """:param consume: get_all() by basic_consume instead of basic_get polling
+        :param durability: none: transient messages, others: persistent (fsync is up to the broker)
+        """
         super().__init__()
         self.__host = host
+        self.__port = port
+        self.durability = durability or Durability()
+        self.properties = pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
+                                               if self.durability.persistent else pika.spec.TRANSIENT_DELIVERY_MODE)
+        self.consume = consume
+        self.prefetch = prefetch if consume else 1
+        if consume:
+            self.title = f"{self.title} [consume, prefetch={prefetch}]"
 
     def open(self, count: int):
         super().open(count)
-        self.__conn = pika.BlockingConnection(pika.ConnectionParameters(host=self.__host))
+        self.__conn = pika.BlockingConnection(pika.ConnectionParameters(host=self.__host, port=self.__port))
         self.chan = self.__conn.channel()
         self.chan.confirm_delivery()  # publish confirm
-        self.chan.basic_qos(prefetch_count=1)  # get by 1
+        self.tx_chan = self.__conn.channel()
+        self.tx_chan.tx_select()  # publish confirm for a batch
+
+    def consumer_channel(self) -> pika.adapters.blocking_connection.BlockingChannel:
+        """New channel with the consume window."""
+        chan = self.__conn.channel()
+        chan.basic_qos(prefetch_count=self.prefetch)
+        return chan
+
+    def chan_shared(self) -> bool:
+        """Other queues use the channel too."""
+        return self._count > 1
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        for k in ('_QSRc__conn', 'chan', 'tx_chan'):
+            state.pop(k, None)
+        return state
 
     def close(self):
+        super().close()
+        self.tx_chan.close()
         self.chan.close()
         self.__conn.close()
@@ -0,0 +1,268 @@
+"""Queue Sync Shared memory.
+SPSC ring buffer per queue in `multiprocessing.shared_memory`: messages cross processes w/o pickling or pipes.
+Lock-free: the writer owns tail, the reader owns head (aligned 8-byte stores); data is written before tail.
+Blocking get()/full put() sleep on a futex word in the segment (Linux), elsewhere they poll;
+full put() gives up (QExc) if no reader frees room for FULL_WAIT.
+Record: <len:u32><data>; len == 0xFFFFFFFF: wrap to ring start.
+"""
+# 1. std
+from typing import Iterator, Iterable, List, Optional, Callable
+from multiprocessing import shared_memory, resource_tracker
+import ctypes
+import platform
+import struct
+import sys
+import threading
+import time
+# 3. local
+from q import QExc, LockScope, QS, QSc
+# x. const
+RING_SIZE = 1 << 20  # bytes per queue
+PREFIX = 'mqt_'  # segment name prefix
+WAIT_TICK = 0.1  # s, futex wait timeout (lost wakeup guard) / poll period
+FULL_WAIT = 1.0  # s, full put(): no room freed for that long == no reader running
+_LEN = struct.Struct('<I')
+_WRAP = 0xFFFFFFFF
+# header: u64 × 5, u32 × 4 (futex words and waiting flags)
+_TAIL, _HEAD, _N_PUT, _N_GET, _CAP = range(5)
+_W_SEQ, _W_WAIT, _R_SEQ, _R_WAIT = range(4)  # w: data written, r: room freed
+_U32_OFF = 40
+_HDR_SIZE = 64
+_SYS_FUTEX = {'x86_64': 202, 'aarch64': 98}.get(platform.machine()) if sys.platform == 'linux' else None
+_FUTEX_WAIT, _FUTEX_WAKE = 0, 1  # not _PRIVATE: shared between processes
+_libc = ctypes.CDLL(None, use_errno=True) if _SYS_FUTEX else None
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _futex_wait(addr: int, val: int):
+    """Sleep while u32 at addr == val (WAIT_TICK max)."""
+    if _libc:
+        ts = _Timespec(int(WAIT_TICK), int(WAIT_TICK % 1 * 1_000_000_000))
+        _libc.syscall(_SYS_FUTEX, ctypes.c_void_p(addr), _FUTEX_WAIT, ctypes.c_uint(val), ctypes.byref(ts), None, 0)
+    else:
+        time.sleep(WAIT_TICK / 100)
+
+
+def _futex_wake(addr: int):
+    if _libc:
+        _libc.syscall(_SYS_FUTEX, ctypes.c_void_p(addr), _FUTEX_WAKE, 1, None, None, 0)
+
+
+def ring_size(msgs: int, max_len: int) -> int:
+    """Ring bytes to keep msgs of up to max_len bytes all at once (+ a wrap), RING_SIZE min."""
+    return max(RING_SIZE, (msgs + 1) * (_LEN.size + max_len))
+
+
+def _shm(name: str, size: int = 0) -> shared_memory.SharedMemory:
+    """Create (size > 0) or attach segment; lifetime is ours, not the resource tracker's."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, bool(size), size, track=False)
+    shm = shared_memory.SharedMemory(name, bool(size), size)
+    resource_tracker.unregister(shm._name, 'shared_memory')  # noqa; would unlink on (any) process exit
+    return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    if sys.version_info < (3, 13):
+        resource_tracker.register(shm._name, 'shared_memory')  # noqa; unlink() unregisters
+    try:
+        shm.unlink()
+    except FileNotFoundError:  # removed by the other side
+        if sys.version_info < (3, 13):
+            resource_tracker.unregister(shm._name, 'shared_memory')  # noqa
+
+
+class _QSS(QS):
+    """Shared memory Sync Queue."""
+    _master: 'QSSc'
+    __shm: Optional[shared_memory.SharedMemory]
+    __hdr: memoryview  # u64
+    __u32: memoryview
+    __data: memoryview
+    __cap: int
+    __addr: int  # of u32 words, for futex
+    __w_lock: threading.Lock  # single producer (threads of this process)
+    __r_lock: threading.Lock  # single consumer
+
+    def __init__(self, master: 'QSSc', __id: int):
+        super().__init__(master, __id)
+        self.__shm = None
+        self.__w_lock = threading.Lock()
+        self.__r_lock = threading.Lock()
+
+    def open(self):
+        name = f"{self._master.prefix}{self._q_name}"
+        try:
+            shm = _shm(name, _HDR_SIZE + self._master.size)
+            shm.buf[_CAP * 8:_CAP * 8 + 8] = struct.pack('<Q', self._master.size)
+        except FileExistsError:
+            shm = _shm(name)
+        self.__shm = shm
+        self.__hdr = shm.buf[:_U32_OFF].cast('Q')
+        self.__u32 = shm.buf[_U32_OFF:_U32_OFF + 16].cast('I')
+        while not (cap := self.__hdr[_CAP]):  # creator is setting up
+            time.sleep(0)
+        self.__cap = cap
+        self.__data = shm.buf[_HDR_SIZE:_HDR_SIZE + cap]
+        word = ctypes.c_char.from_buffer(shm.buf, _U32_OFF)
+        self.__addr = ctypes.addressof(word)
+        del word  # release buffer export
+
+    def __wait(self, seq: int, flag: int, ready: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+        """Sleep on futex word seq until ready() or timeout, s.
+        :return: ready
+        """
+        u32 = self.__u32
+        until = time.monotonic() + timeout if timeout is not None else None
+        while not (ret := ready()):
+            if until is not None and time.monotonic() >= until:
+                break
+            val = u32[seq]
+            u32[flag] = 1
+            if ret := ready():  # re-check after flag is visible
+                break
+            _futex_wait(self.__addr + seq * 4, val)
+        u32[flag] = 0
+        return ret
+
+    def __wake(self, seq: int, flag: int):
+        u32 = self.__u32
+        u32[seq] = (u32[seq] + 1) & 0xFFFFFFFF
+        if u32[flag]:
+            _futex_wake(self.__addr + seq * 4)
+
+    def count(self) -> int:
+        return self.__hdr[_N_PUT] - self.__hdr[_N_GET]
+
+    def put(self, data: bytes):
+        self.put_many((data,))
+
+    def put_many(self, data: Iterable[bytes]):
+        with self.__w_lock:
+            self.__put_many(data)
+
+    def __put_many(self, data: Iterable[bytes]):
+        hdr, buf, cap = self.__hdr, self.__data, self.__cap
+        tail, n_put = hdr[_TAIL], hdr[_N_PUT]
+        n0, size = n_put, 0
+        for item in data:
+            n = len(item)
+            if n + _LEN.size > cap:
+                raise QExc(f"Message too big: {n}")
+            off = tail % cap
+            skip = cap - off if cap - off < _LEN.size + n else 0
+            need = skip + _LEN.size + n
+            if cap - (tail - hdr[_HEAD]) < need:  # full: publish what is written, wait for reader
+                self.__publish(tail, n_put)
+                head = hdr[_HEAD]
+                while not self.__wait(_R_SEQ, _R_WAIT, lambda: cap - (tail - hdr[_HEAD]) >= need, FULL_WAIT):
+                    if hdr[_HEAD] == head:
+                        self._st.put(n_put - n0, size)
+                        raise QExc(f"Ring full ({cap} bytes, {self.count()} msgs), no reader")
+                    head = hdr[_HEAD]
+            if skip:
+                if skip >= _LEN.size:
+                    _LEN.pack_into(buf, off, _WRAP)
+                tail += skip
+                off = 0
+            _LEN.pack_into(buf, off, n)
+            buf[off + _LEN.size:off + _LEN.size + n] = item
+            tail += _LEN.size + n
+            n_put += 1
+            size += n
+        self.__publish(tail, n_put)
+        self._st.put(n_put - n0, size)
+
+    def __publish(self, tail: int, n_put: int):
+        hdr = self.__hdr
+        if tail != hdr[_TAIL]:
+            hdr[_TAIL] = tail
+            hdr[_N_PUT] = n_put
+            self.__wake(_W_SEQ, _W_WAIT)
+
+    def get(self, wait: bool = True) -> Optional[bytes]:
+        with self.__r_lock:
+            if wait:
+                hdr = self.__hdr
+                self.__wait(_W_SEQ, _W_WAIT, lambda: hdr[_TAIL] != hdr[_HEAD])
+            if ret := self.__read(1, True):
+                return ret[0]
+
+    def get_many(self, max_n: int) -> List[bytes]:
+        with self.__r_lock:
+            return self.__read(max_n, True)
+
+    def get_all(self):
+        with self.__r_lock:
+            self.__read(sys.maxsize, False)
+
+    def __read(self, max_n: int, keep: bool) -> List[bytes]:
+        """Consume up to max_n records.
+        :param keep: return them (else just skip)
+        """
+        hdr, buf, cap = self.__hdr, self.__data, self.__cap
+        head, tail = hdr[_HEAD], hdr[_TAIL]
+        ret = []
+        got = size = 0
+        while head < tail and got < max_n:
+            off = head % cap
+            n = _LEN.unpack_from(buf, off)[0] if cap - off >= _LEN.size else _WRAP
+            if n == _WRAP:
+                head += cap - off
+                continue
+            if keep:
+                ret.append(bytes(buf[off + _LEN.size:off + _LEN.size + n]))
+            head += _LEN.size + n
+            got += 1
+            size += n
+        if got:
+            hdr[_HEAD] = head
+            hdr[_N_GET] += got
+            self.__wake(_R_SEQ, _R_WAIT)
+            self._st.n_get += got
+            self._st.b_get += size
+        return ret
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self) -> bytes:
+        if (item := self.get(False)) is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        """Unmap; segment is removed if empty."""
+        if not self.__shm:
+            return
+        empty = not self.count()
+        for view in (self.__hdr, self.__u32, self.__data):
+            view.release()
+        self.__shm.close()
+        if empty:
+            _unlink(self.__shm)
+        self.__shm = None
+
+
+class QSSc(QSc):
+    """Shared memory Sync Queue Container.
+    Single producer/single consumer per queue at a time: threads of a process take a writer/reader lock per queue,
+    so a put() waiting for room does not block the reader.
+    """
+    title: str = "Queue Sync (Shared memory (SPSC ring))"
+    lock_scope = LockScope.No
+    shared = True
+    _child_cls = _QSS
+    size: int
+    prefix: str
+
+    def __init__(self, size: int = RING_SIZE, prefix: str = PREFIX):
+        """:param size: ring bytes per queue (new segments; see ring_size())
+        :param prefix: segment names prefix
+        """
+        super().__init__()
+        self.size = size
+        self.prefix = prefix
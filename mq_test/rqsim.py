@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""RabbitMQ stand-in: in-process AMQP 0-9-1 broker (subset used by QSR/QAR1/QAR2 and rq_mk_queue).
+Powered by [pamqp](https://github.com/gmr/pamqp) (aiormq dependency).
+Supported: default exchange only, queue.declare (incl. passive)/purge/delete, basic.publish (+ confirms, tx),
+basic.get, basic.qos (per consumer), basic.consume/cancel, basic.ack/nack/reject.
+Not persistent; `delivery_mode` is ignored.
+:note: `delay` postpones every server->client frame, i.e. emulates network/broker latency.
+"""
+# 1. std
+from typing import Dict, List, Tuple, Optional, Iterable, Deque
+import argparse
+import asyncio
+import collections
+import itertools
+import struct
+import threading
+# 2. 3rd
+from pamqp import commands, frame, header, body, heartbeat, base
+# x. const
+PROTOCOL_HEADER = b'AMQP\x00\x00\x09\x01'
+FRAME_MAX = 131072
+CAPABILITIES = {
+    'publisher_confirms': True,
+    'basic.nack': True,
+    'consumer_cancel_notify': True,
+    'exchange_exchange_bindings': True,
+    'authentication_failure_close': True,
+    'per_consumer_qos': True,
+}
+Msg = Tuple[commands.Basic.Properties, bytes]
+
+
+class _Consumer:
+    chan: '_Chan'
+    tag: str
+    queue: str
+    no_ack: bool
+    prefetch: int  # 0 == unlimited
+    unacked: int
+
+    def __init__(self, chan: '_Chan', tag: str, queue: str, no_ack: bool):
+        self.chan = chan
+        self.tag = tag
+        self.queue = queue
+        self.no_ack = no_ack
+        self.prefetch = chan.prefetch
+        self.unacked = 0
+
+    def ready(self) -> bool:
+        return self.no_ack or not self.prefetch or self.unacked < self.prefetch
+
+
+class _Chan:
+    """Channel state."""
+    conn: '_Conn'
+    id: int
+    confirm: bool
+    tx: bool
+    prefetch: int
+    closing: bool
+    publish_seq: int  # confirm mode delivery tags
+    delivery_tag: int
+    unacked: Dict[int, Tuple[str, Msg, Optional[_Consumer]]]
+    consumers: Dict[str, _Consumer]
+    tx_pending: List[Tuple[str, Msg]]
+    publish: Optional[commands.Basic.Publish]  # being assembled
+    props: Optional[commands.Basic.Properties]
+    size: int
+    chunks: List[bytes]
+
+    def __init__(self, conn: '_Conn', _id: int):
+        self.conn = conn
+        self.id = _id
+        self.confirm = self.tx = self.closing = False
+        self.prefetch = self.publish_seq = self.delivery_tag = 0
+        self.unacked = {}
+        self.consumers = {}
+        self.tx_pending = []
+        self.publish = self.props = None
+        self.size = 0
+        self.chunks = []
+
+
+class _Conn:
+    """Client connection."""
+    __broker: 'Broker'
+    __reader: asyncio.StreamReader
+    __writer: asyncio.StreamWriter
+    __chans: Dict[int, _Chan]
+    __out: asyncio.Queue  # (due, data) if broker.delay
+    __tasks: List[asyncio.Task]
+
+    def __init__(self, broker: 'Broker', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.__broker = broker
+        self.__reader = reader
+        self.__writer = writer
+        self.__chans = {}
+        self.__out = asyncio.Queue()
+        self.__tasks = []
+        self.__handlers = {
+            commands.Connection.StartOk: self.__start_ok,
+            commands.Connection.TuneOk: self.__tune_ok,
+            commands.Connection.Open: self.__conn_open,
+            commands.Connection.Close: self.__conn_close,
+            commands.Connection.CloseOk: self.__conn_close_ok,
+            commands.Channel.Open: self.__chan_open,
+            commands.Channel.Close: self.__chan_close,
+            commands.Channel.CloseOk: self.__chan_close_ok,
+            commands.Confirm.Select: self.__confirm_select,
+            commands.Tx.Select: self.__tx_select,
+            commands.Tx.Commit: self.__tx_commit,
+            commands.Tx.Rollback: self.__tx_rollback,
+            commands.Basic.Qos: self.__basic_qos,
+            commands.Queue.Declare: self.__queue_declare,
+            commands.Queue.Purge: self.__queue_purge,
+            commands.Queue.Delete: self.__queue_delete,
+            commands.Basic.Publish: self.__basic_publish,
+            commands.Basic.Get: self.__basic_get,
+            commands.Basic.Consume: self.__basic_consume,
+            commands.Basic.Cancel: self.__basic_cancel,
+            commands.Basic.Ack: self.__basic_ack,
+            commands.Basic.Nack: self.__basic_nack,
+            commands.Basic.Reject: self.__basic_reject,
+        }
+
+    # == io ==
+    async def run(self):
+        if self.__broker.delay:
+            self.__tasks.append(asyncio.create_task(self.__delayed_writer()))
+        try:
+            if await self.__reader.readexactly(8) != PROTOCOL_HEADER:
+                self.__writer.write(PROTOCOL_HEADER)
+                return
+            self._send(0, commands.Connection.Start(
+                server_properties={'product': 'rqsim', 'capabilities': CAPABILITIES},
+                mechanisms='PLAIN AMQPLAIN'
+            ))
+            while not self.__writer.is_closing():
+                head = await self.__reader.readexactly(7)
+                rest = await self.__reader.readexactly(struct.unpack('>BHI', head)[2] + 1)
+                _, chan_id, value = frame.unmarshal(head + rest)
+                self.__on_frame(chan_id, value)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            ...
+        finally:
+            for chan in list(self.__chans.values()):
+                self.__drop_chan(chan)
+            await self.__out.join()
+            for task in self.__tasks:
+                task.cancel()
+            self.__writer.close()
+
+    async def __delayed_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due, data = await self.__out.get()
+            if (pause := due - loop.time()) > 0:
+                await asyncio.sleep(pause)
+            if not self.__writer.is_closing():
+                self.__writer.write(data)
+                await self.__writer.drain()
+            self.__out.task_done()
+
+    async def __heartbeat(self, interval: int):
+        while True:
+            await asyncio.sleep(interval / 2)
+            self._send(0, heartbeat.Heartbeat())
+
+    def _send(self, chan_id: int, *values):
+        data = b''.join(frame.marshal(v, chan_id) for v in values)
+        if self.__broker.delay:
+            self.__out.put_nowait((asyncio.get_running_loop().time() + self.__broker.delay, data))
+        elif not self.__writer.is_closing():
+            self.__writer.write(data)
+
+    def _deliver(self, chan: _Chan, method: base.Frame, msg: Msg):
+        props, data = msg
+        frames = [method, header.ContentHeader(body_size=len(data), properties=props)]
+        step = FRAME_MAX - 8
+        frames.extend(body.ContentBody(data[i:i + step]) for i in range(0, len(data), step))
+        self._send(chan.id, *frames)
+
+    def __on_frame(self, chan_id: int, value):
+        if isinstance(value, heartbeat.Heartbeat):
+            return
+        chan = self.__chans.get(chan_id)
+        if isinstance(value, (header.ContentHeader, body.ContentBody)):
+            if chan and chan.publish:
+                self.__content(chan, value)
+            return
+        if chan and chan.closing and not isinstance(value, commands.Channel.CloseOk):
+            return  # ignored until close-ok
+        if handler := self.__handlers.get(type(value)):
+            handler(chan_id, chan, value)
+        else:
+            self.__chan_error(chan_id, chan, value, 540, f"NOT_IMPLEMENTED - {value.name}")
+
+    def __chan_error(self, chan_id: int, chan: Optional[_Chan], value: base.Frame, code: int, text: str):
+        if chan:
+            chan.closing = True
+        self._send(chan_id, commands.Channel.Close(code, text, value.index >> 16, value.index & 0xFFFF))
+
+    # == connection ==
+    def __start_ok(self, *_):
+        self._send(0, commands.Connection.Tune(channel_max=2047, frame_max=FRAME_MAX, heartbeat=0))
+
+    def __tune_ok(self, _: int, __: Optional[_Chan], value: commands.Connection.TuneOk):
+        if value.heartbeat:
+            self.__tasks.append(asyncio.create_task(self.__heartbeat(value.heartbeat)))
+
+    def __conn_open(self, *_):
+        self._send(0, commands.Connection.OpenOk())
+
+    def __conn_close(self, *_):
+        self._send(0, commands.Connection.CloseOk())
+        self.__reader.feed_eof()
+
+    def __conn_close_ok(self, *_):
+        self.__reader.feed_eof()
+
+    # == channel ==
+    def __chan_open(self, chan_id: int, *_):
+        self.__chans[chan_id] = _Chan(self, chan_id)
+        self._send(chan_id, commands.Channel.OpenOk())
+
+    def __drop_chan(self, chan: _Chan):
+        """Requeue unacked and forget consumers."""
+        self.__chans.pop(chan.id, None)
+        for consumer in chan.consumers.values():
+            self.__broker.unsubscribe(consumer)
+        for qname, msg, _ in reversed(list(chan.unacked.values())):
+            self.__broker.requeue(qname, msg)
+        chan.unacked.clear()
+
+    def __chan_close(self, chan_id: int, chan: Optional[_Chan], _):
+        if chan:
+            self.__drop_chan(chan)
+        self._send(chan_id, commands.Channel.CloseOk())
+
+    def __chan_close_ok(self, _: int, chan: Optional[_Chan], __):
+        if chan:
+            self.__drop_chan(chan)
+
+    def __confirm_select(self, chan_id: int, chan: _Chan, value: commands.Confirm.Select):
+        chan.confirm = True
+        if not value.nowait:
+            self._send(chan_id, commands.Confirm.SelectOk())
+
+    def __tx_select(self, chan_id: int, chan: _Chan, _):
+        chan.tx = True
+        self._send(chan_id, commands.Tx.SelectOk())
+
+    def __tx_commit(self, chan_id: int, chan: _Chan, _):
+        for qname, msg in chan.tx_pending:
+            self.__broker.publish(qname, msg)
+        chan.tx_pending.clear()
+        self._send(chan_id, commands.Tx.CommitOk())
+
+    def __tx_rollback(self, chan_id: int, chan: _Chan, _):
+        chan.tx_pending.clear()
+        self._send(chan_id, commands.Tx.RollbackOk())
+
+    def __basic_qos(self, chan_id: int, chan: _Chan, value: commands.Basic.Qos):
+        chan.prefetch = value.prefetch_count
+        self._send(chan_id, commands.Basic.QosOk())
+
+    # == queue ==
+    def __queue_declare(self, chan_id: int, chan: _Chan, value: commands.Queue.Declare):
+        qname = value.queue or f"amq.gen-{next(self.__broker.seq)}"
+        if value.passive and qname not in self.__broker.queues:
+            self.__chan_error(chan_id, chan, value, 404, f"NOT_FOUND - no queue '{qname}' in vhost '/'")
+            return
+        q = self.__broker.declare(qname)
+        if not value.nowait:
+            self._send(chan_id, commands.Queue.DeclareOk(qname, len(q), len(self.__broker.consumers[qname])))
+
+    def __queue_purge(self, chan_id: int, chan: _Chan, value: commands.Queue.Purge):
+        if (q := self.__broker.queues.get(value.queue)) is None:
+            self.__chan_error(chan_id, chan, value, 404, f"NOT_FOUND - no queue '{value.queue}' in vhost '/'")
+            return
+        count = len(q)
+        q.clear()
+        if not value.nowait:
+            self._send(chan_id, commands.Queue.PurgeOk(count))
+
+    def __queue_delete(self, chan_id: int, _: _Chan, value: commands.Queue.Delete):
+        q = self.__broker.queues.pop(value.queue, ())
+        for consumer in self.__broker.consumers.pop(value.queue, []):
+            consumer.chan.consumers.pop(consumer.tag, None)
+        if not value.nowait:
+            self._send(chan_id, commands.Queue.DeleteOk(len(q)))
+
+    # == basic ==
+    def __basic_publish(self, _: int, chan: _Chan, value: commands.Basic.Publish):
+        chan.publish = value
+        chan.props = None
+        chan.size = 0
+        chan.chunks = []
+
+    def __content(self, chan: _Chan, value):
+        if isinstance(value, header.ContentHeader):
+            chan.props = value.properties
+            chan.size = value.body_size
+        else:
+            chan.chunks.append(value.value)
+        if chan.props is None or sum(map(len, chan.chunks)) < chan.size:
+            return
+        publish, msg = chan.publish, (chan.props, b''.join(chan.chunks))
+        chan.publish = None
+        if publish.exchange == '':  # default exchange only; unroutable are dropped
+            if chan.tx:
+                chan.tx_pending.append((publish.routing_key, msg))
+            else:
+                self.__broker.publish(publish.routing_key, msg)
+        if chan.confirm:
+            chan.publish_seq += 1
+            self._send(chan.id, commands.Basic.Ack(chan.publish_seq))
+
+    def __basic_get(self, chan_id: int, chan: _Chan, value: commands.Basic.Get):
+        q = self.__broker.queues.get(value.queue)
+        if q is None:
+            self.__chan_error(chan_id, chan, value, 404, f"NOT_FOUND - no queue '{value.queue}' in vhost '/'")
+            return
+        if not q:
+            self._send(chan_id, commands.Basic.GetEmpty())
+            return
+        msg = q.popleft()
+        chan.delivery_tag += 1
+        if not value.no_ack:
+            chan.unacked[chan.delivery_tag] = (value.queue, msg, None)
+        self._deliver(chan, commands.Basic.GetOk(chan.delivery_tag, False, '', value.queue, len(q)), msg)
+
+    def __basic_consume(self, chan_id: int, chan: _Chan, value: commands.Basic.Consume):
+        if value.queue not in self.__broker.queues:
+            self.__chan_error(chan_id, chan, value, 404, f"NOT_FOUND - no queue '{value.queue}' in vhost '/'")
+            return
+        tag = value.consumer_tag or f"ctag-{next(self.__broker.seq)}"
+        consumer = chan.consumers[tag] = _Consumer(chan, tag, value.queue, value.no_ack)
+        if not value.nowait:
+            self._send(chan_id, commands.Basic.ConsumeOk(tag))
+        self.__broker.subscribe(consumer)
+
+    def __basic_cancel(self, chan_id: int, chan: _Chan, value: commands.Basic.Cancel):
+        if consumer := chan.consumers.pop(value.consumer_tag, None):
+            self.__broker.unsubscribe(consumer)
+        if not value.nowait:
+            self._send(chan_id, commands.Basic.CancelOk(value.consumer_tag))
+
+    def deliver(self, consumer: _Consumer, msg: Msg):
+        chan = consumer.chan
+        chan.delivery_tag += 1
+        if not consumer.no_ack:
+            chan.unacked[chan.delivery_tag] = (consumer.queue, msg, consumer)
+            consumer.unacked += 1
+        self._deliver(chan, commands.Basic.Deliver(consumer.tag, chan.delivery_tag, False, '', consumer.queue), msg)
+
+    def __settle(self, chan_id: int, chan: _Chan, value: base.Frame, tag: int, multiple: bool, requeue: bool):
+        """:note: as RabbitMQ: unknown (or already settled) tag closes the channel; multiple with tag 0: all"""
+        if tag not in chan.unacked and not (multiple and tag == 0):
+            self.__chan_error(chan_id, chan, value, 406, f"PRECONDITION_FAILED - unknown delivery tag {tag}")
+            return
+        tags = [t for t in chan.unacked if t <= tag or not tag] if multiple else [tag]
+        queues = set()
+        for t in (reversed(tags) if requeue else tags):
+            qname, msg, consumer = chan.unacked.pop(t)
+            if consumer:
+                consumer.unacked -= 1
+            if requeue:
+                self.__broker.requeue(qname, msg)
+            queues.add(qname)
+        for qname in queues:
+            self.__broker.dispatch(qname)
+
+    def __basic_ack(self, chan_id: int, chan: _Chan, value: commands.Basic.Ack):
+        self.__settle(chan_id, chan, value, value.delivery_tag, value.multiple, False)
+
+    def __basic_nack(self, chan_id: int, chan: _Chan, value: commands.Basic.Nack):
+        self.__settle(chan_id, chan, value, value.delivery_tag, value.multiple, value.requeue)
+
+    def __basic_reject(self, chan_id: int, chan: _Chan, value: commands.Basic.Reject):
+        self.__settle(chan_id, chan, value, value.delivery_tag, False, value.requeue)
+
+
+class Broker:
+    """In-process AMQP broker.
+    Use as `await broker.serve()` in a running loop or `broker.start()`/`broker.stop()` (own thread).
+    """
+    host: str
+    port: int  # 0 == any free
+    delay: float  # s, added to every reply
+    queues: Dict[str, Deque[Msg]]
+    consumers: Dict[str, List[_Consumer]]
+    seq: Iterable[int]  # generated names
+    __server: Optional[asyncio.AbstractServer]
+    __loop: Optional[asyncio.AbstractEventLoop]
+    __thread: Optional[threading.Thread]
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0, queues: Iterable[str] = ()):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.queues = {}
+        self.consumers = {}
+        self.seq = itertools.count(1)
+        self.__server = self.__loop = self.__thread = None
+        for qname in queues:
+            self.declare(qname)
+
+    @property
+    def url(self) -> str:
+        return f"amqp://guest:guest@{self.host}:{self.port}/"
+
+    # == storage ==
+    def declare(self, qname: str) -> Deque[Msg]:
+        if qname not in self.queues:
+            self.queues[qname] = collections.deque()
+            self.consumers[qname] = []
+        return self.queues[qname]
+
+    def publish(self, qname: str, msg: Msg):
+        if (q := self.queues.get(qname)) is not None:
+            q.append(msg)
+            if self.consumers[qname]:
+                self.dispatch(qname)
+
+    def requeue(self, qname: str, msg: Msg):
+        if (q := self.queues.get(qname)) is not None:
+            q.appendleft(msg)
+
+    def subscribe(self, consumer: _Consumer):
+        self.consumers[consumer.queue].append(consumer)
+        self.dispatch(consumer.queue)
+
+    def unsubscribe(self, consumer: _Consumer):
+        if consumer in (consumers := self.consumers.get(consumer.queue, [])):
+            consumers.remove(consumer)
+
+    def dispatch(self, qname: str):
+        """Push messages to ready consumers, round-robin."""
+        q, consumers = self.queues.get(qname), self.consumers.get(qname)
+        while q and consumers:
+            ready = [c for c in consumers if c.ready()]
+            if not ready:
+                break
+            for consumer in ready:
+                if not q or not consumer.ready():
+                    break
+                consumer.chan.conn.deliver(consumer, q.popleft())
+
+    # == server ==
+    async def serve(self):
+        """Start listening (port is known after)."""
+        async def __on_conn(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            conn = _Conn(self, reader, writer)
+            await conn.run()
+
+        self.__server = await asyncio.start_server(__on_conn, self.host, self.port)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def aclose(self):
+        self.__server.close()
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}  # connections left
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.__server.wait_closed()
+
+    def start(self) -> 'Broker':
+        """Run in background thread."""
+        ready = threading.Event()
+
+        def __run():
+            self.__loop = asyncio.new_event_loop()
+            self.__loop.run_until_complete(self.serve())
+            ready.set()
+            self.__loop.run_forever()
+            self.__loop.run_until_complete(self.aclose())
+            self.__loop.close()
+
+        self.__thread = threading.Thread(target=__run, name='rqsim', daemon=True)
+        self.__thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5672)
+    parser.add_argument('--delay', type=float, default=0.0, help="reply latency, s")
+    parser.add_argument('--queues', type=int, default=0, help="predeclare N queues (0000...)")
+    args = parser.parse_args()
+    broker = Broker(args.host, args.port, args.delay, (f"{i:04d}" for i in range(args.queues)))
+
+    async def __inner():
+        await broker.serve()
+        print(f"Listening {broker.url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(__inner())
+    except KeyboardInterrupt:
+        ...
+
+
+if __name__ == '__main__':
+    main()